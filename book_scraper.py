@@ -1,188 +1,2570 @@
 import click
 import requests
-from bs4 import BeautifulSoup
-from markdownify import markdownify as md
+from bs4 import BeautifulSoup, UnicodeDammit
+from lxml import etree
+import lxml.html
 from readability import Document
+from html import escape
 from pathlib import Path
 import re
-from urllib.parse import urljoin, urlparse
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse
+from urllib.robotparser import RobotFileParser
 import weasyprint
 import time
 import markdown
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from email.utils import parsedate_to_datetime
+from functools import partial
+import hashlib
+import gzip
+import json
+import multiprocessing
+import os
+import random
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+class FetchScheduler:
+    """Run fetches on a shared thread pool while capping concurrent requests per host
+
+    The cap is max_per_host, or whatever an AdaptiveConcurrency controller
+    currently allows for the host when one is given. After shutdown(),
+    submit() hands back an already-cancelled Future.
+    """
+
+    def __init__(self, jobs=1, max_per_host=1, controller=None):
+        self.jobs = max(1, jobs)
+        self.max_per_host = max(1, max_per_host)
+        self.controller = controller
+        self._executor = ThreadPoolExecutor(max_workers=self.jobs)
+        self._lock = threading.Lock()
+        self._pending = {}  # host -> deque of (fn, url, future) waiting for a slot
+        self._active = {}  # host -> number of requests currently running
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, fn, url):
+        """Schedule fn(url) and return a Future for its result"""
+        future = Future()
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if not self._closed:
+                self._pending.setdefault(host, deque()).append((fn, url, future))
+                self._dispatch(host)
+                return future
+        future.cancel()
+        return future
+
+    def map_ordered(self, fn, urls):
+        """Yield (url, result) pairs in input order while fetches run concurrently"""
+        futures = [self.submit(fn, url) for url in urls]
+        try:
+            for url, future in zip(urls, futures):
+                yield url, future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._closed = True
+            queued = [future for queue in self._pending.values() for _, _, future in queue]
+            self._pending.clear()
+        # Cancel outside the lock: done-callbacks may hand shared work to another scheduler
+        for future in queued:
+            future.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def _dispatch(self, host):
+        # Caller holds self._lock. Only hand work to the pool when the host has a
+        # free slot, so a busy host never ties up workers that other hosts could use.
+        queue = self._pending.get(host)
+        limit = self.controller.limit(host) if self.controller else self.max_per_host
+        while queue and self._active.get(host, 0) < limit:
+            fn, url, future = queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._active[host] = self._active.get(host, 0) + 1
+            self._executor.submit(self._run, host, fn, url, future)
+
+    def _run(self, host, fn, url, future):
+        try:
+            result = fn(url)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._active[host] -= 1
+                self._dispatch(host)
+
+class AdaptiveConcurrency:
+    """AIMD controller for per-host concurrency, fed by BookScraper request records
+
+    Register it as a request hook and pass it to FetchScheduler. Each healthy
+    response adds 1/limit to the host's limit, so it grows by about one per
+    round of requests. A 429/5xx, a timeout or connection error, or a
+    latency spike well above the host's baseline multiplies it by backoff,
+    at most once per cooldown so one bad burst does not collapse it. Latency
+    is time to first byte plus transfer, which leaves out our own rate
+    limiter's waiting.
+    """
+
+    def __init__(self, initial=1, maximum=16, minimum=1, backoff=0.5, spike_ratio=2.0, min_spike=0.1,
+                 cooldown=1.0, verbose=True):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.initial = min(max(initial, self.minimum), self.maximum)
+        self.backoff = backoff
+        self.spike_ratio = spike_ratio
+        self.min_spike = min_spike  # seconds a spike must also exceed the baseline by
+        self.cooldown = cooldown
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._hosts = {}  # host -> {'limit', 'baseline', 'last_decrease', 'increases', 'decreases'}
+
+    def limit(self, host):
+        """Concurrent requests currently allowed to host"""
+        state = self._hosts.get(host)
+        return int(state['limit']) if state else self.initial
+
+    def limits(self):
+        with self._lock:
+            return {host: int(state['limit']) for host, state in self._hosts.items()}
+
+    def __call__(self, record):
+        if record['cache'] == 'hit':
+            return  # answered from the cache without touching the host
+        host = record['host']
+        latency = record['ttfb'] + record['transfer']
+        with self._lock:
+            state = self._hosts.setdefault(host, {
+                'limit': float(self.initial), 'baseline': None, 'last_decrease': 0.0, 'increases': 0, 'decreases': 0,
+            })
+            before = int(state['limit'])
+            baseline = state['baseline']
+            overloaded = record['status'] in TRANSIENT_STATUSES or record.get('transient')
+            spike = (
+                record['error'] is None and baseline is not None
+                and latency > baseline * self.spike_ratio and latency > baseline + self.min_spike
+            )
+            now = time.monotonic()
+            reason = None
+            if overloaded or spike:
+                if now - state['last_decrease'] >= self.cooldown:
+                    state['limit'] = max(self.minimum, state['limit'] * self.backoff)
+                    state['last_decrease'] = now
+                    state['decreases'] += 1
+                if not overloaded:
+                    reason = "latency spike"
+                else:
+                    reason = f"HTTP {record['status']}" if record['status'] else "connection error"
+                if spike:
+                    state['baseline'] = 0.8 * baseline + 0.2 * latency  # follow a lasting shift
+            elif record['error'] is None:
+                state['limit'] = min(self.maximum, state['limit'] + 1.0 / state['limit'])
+                state['increases'] += 1
+                state['baseline'] = latency if baseline is None else 0.8 * baseline + 0.2 * latency
+                reason = "healthy responses"
+            after = int(state['limit'])
+        if self.verbose and after != before:
+            click.echo(f"  {host} concurrency {before} -> {after} ({reason})")
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution
+
+    Callers arriving while a call for their key is in flight share its result
+    instead of repeating the work. Each caller gets its own Future, and the
+    shared work is only cancelled once every caller waiting on it has given up.
+    If it is cancelled from elsewhere while callers still wait (say the
+    scheduler driving it shut down), a remaining caller starts it again.
+    """
 
-class BookScraper:
     def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> {'future': Future, 'waiters': [(Future, start)], 'abandoned': bool}
+        self.stats = {'calls': 0, 'executed': 0, 'coalesced': 0, 'restarted': 0}
+
+    def future(self, key, start):
+        """Future for key's in-flight call, calling start() to launch one if there is none
+
+        start must not block; it returns a Future for the shared work. It may
+        also be called later to restart work that was cancelled under this
+        caller, and should then return a cancelled Future if it cannot run.
+        """
+        return self._join(key, start)[0]
+
+    def do(self, key, fn, *args):
+        """Run fn(*args) unless an identical call is already running, and return its result
+
+        If the call it joined is cancelled by whoever drives it, fn runs here instead.
+        """
+        while True:
+            placeholder = Future()
+            waiter, leader = self._join(key, lambda: placeholder, restartable=False)
+            if leader:
+                try:
+                    placeholder.set_result(fn(*args))
+                except BaseException as e:
+                    placeholder.set_exception(e)
+            try:
+                return waiter.result()
+            except CancelledError:
+                if leader:
+                    raise
+
+    def _join(self, key, start, restartable=True):
+        waiter = Future()
+        with self._lock:
+            self.stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'future': None, 'waiters': [], 'abandoned': False}
+                self.stats['executed'] += 1
+            else:
+                self.stats['coalesced'] += 1
+            call['waiters'].append((waiter, start if restartable else None))
+
+        waiter.add_done_callback(lambda f: f.cancelled() and self._release(call))
+        if leader:
+            # Outside the lock: start() may complete (or cancel) its Future straight away
+            self._launch(key, call, start())
+        return waiter, leader
+
+    def _launch(self, key, call, shared):
+        with self._lock:
+            call['future'] = shared
+            abandoned = call['abandoned']
+        if abandoned:
+            shared.cancel()
+        shared.add_done_callback(lambda f: self._finish(key, call, f))
+
+    def _finish(self, key, call, shared):
+        if shared.cancelled():
+            with self._lock:
+                starts = [] if call['abandoned'] else [
+                    start for waiter, start in reversed(call['waiters']) if start and not waiter.done()
+                ]
+            # Cancelled under callers that still wait: hand the work to one of theirs
+            for start in starts:
+                replacement = start()
+                if not replacement.cancelled():
+                    with self._lock:
+                        self.stats['restarted'] += 1
+                    self._launch(key, call, replacement)
+                    return
+
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            waiters = [waiter for waiter, _ in call['waiters']]
+        for waiter in waiters:
+            self._copy(shared, waiter)
+
+    def _release(self, call):
+        with self._lock:
+            abandoned = all(waiter.cancelled() for waiter, _ in call['waiters'])
+            if abandoned:
+                call['abandoned'] = True
+            shared = call['future']
+        if abandoned and shared is not None:
+            shared.cancel()
+
+    @staticmethod
+    def _copy(shared, waiter):
+        try:
+            if shared.cancelled():
+                waiter.cancel()
+            elif shared.exception() is not None:
+                waiter.set_exception(shared.exception())
+            else:
+                waiter.set_result(shared.result())
+        except InvalidStateError:  # the waiter was cancelled meanwhile
+            pass
+
+def parse_retry_after(value):
+    """Convert a Retry-After header (seconds or HTTP date) into seconds from now"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """Per-host token bucket that spaces requests out to a politeness budget
+
+    Tokens refill continuously, so time spent waiting on a response already
+    counts towards the next request instead of being added on top of it.
+    """
+
+    def __init__(self, rate=1.0, burst=1, default_backoff=5.0):
+        self.rate = rate  # requests per second per host; 0 disables limiting
+        self.burst = max(1, burst)
+        self.default_backoff = default_backoff
+        self._lock = threading.Lock()
+        self._buckets = {}  # host -> [tokens, last_refill, blocked_until]
+        self._host_rates = {}  # host -> rate the host asked for, e.g. via Crawl-delay
+
+    def set_host_rate(self, host, rate):
+        """Use rate (without bursting) for one host instead of the default; None restores the default"""
+        with self._lock:
+            if rate is None:
+                self._host_rates.pop(host.lower(), None)
+            else:
+                self._host_rates[host.lower()] = rate
+
+    def host_rate(self, host):
+        return self._host_rates.get(host.lower(), self.rate)
+
+    def _bucket(self, host, now):
+        # Caller holds self._lock
+        rate = self._host_rates.get(host, self.rate)
+        burst = 1 if host in self._host_rates else self.burst
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = [float(burst), now, 0.0]
+        elif rate:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        return bucket, rate
+
+    def acquire(self, url):
+        """Block until a request to url's host fits the budget; return seconds waited"""
+        host = urlparse(url).netloc.lower()
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                bucket, rate = self._bucket(host, now)
+                wait = bucket[2] - now
+                if wait <= 0:
+                    if not rate or bucket[0] >= 1:
+                        bucket[0] -= 1
+                        return waited
+                    wait = (1 - bucket[0]) / rate
+            time.sleep(wait)
+            waited += wait
+
+    def try_acquire(self, url):
+        """Take a token for url's host only if one is free right now; never waits"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            now = time.monotonic()
+            bucket, rate = self._bucket(host, now)
+            if bucket[2] > now or (rate and bucket[0] < 1):
+                return False
+            bucket[0] -= 1
+            return True
+
+    def penalize(self, url, delay=None):
+        """Hold back every request to url's host for delay seconds (e.g. Retry-After)"""
+        host = urlparse(url).netloc.lower()
+        if delay is None:
+            delay = self.default_backoff
+        with self._lock:
+            now = time.monotonic()
+            bucket, _ = self._bucket(host, now)
+            bucket[0] = min(bucket[0], 0.0)
+            bucket[2] = max(bucket[2], now + delay)
+
+def robots_crawl_delay(lines, user_agent):
+    """Crawl-delay in seconds for user_agent (else *), accepting the fractional values RobotFileParser drops"""
+    token = user_agent.split('/')[0].lower()
+    delays = {}  # user-agent -> delay
+    agents = []
+    in_rules = False
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if ':' not in line:
+            continue
+        field, value = (part.strip() for part in line.split(':', 1))
+        field = field.lower()
+        if field == 'user-agent':
+            if in_rules:
+                agents, in_rules = [], False
+            agents.append(value.lower())
+            continue
+        in_rules = True
+        if field == 'crawl-delay':
+            try:
+                delay = float(value)
+            except ValueError:
+                continue
+            for agent in agents:
+                delays.setdefault(agent, delay)
+    for agent, delay in delays.items():
+        if agent != '*' and agent in token:
+            return delay
+    return delays.get('*')
+
+class RobotsPolicy:
+    """Per-host robots.txt rules, fetched at most once per TTL
+
+    Crawl-delay (or Request-rate) sets the host's rate in the RateLimiter, so
+    each host is crawled as fast as it allows rather than at one global rate,
+    and Disallow rules are checked before every request. A missing robots.txt
+    allows everything; one that cannot be fetched is retried sooner.
+    """
+
+    def __init__(self, fetch, user_agent, rate_limiter, ttl=24 * 3600.0, retry_ttl=300.0):
+        self.fetch = fetch  # robots.txt URL -> response
+        self.user_agent = user_agent
+        self.rate_limiter = rate_limiter
+        self.ttl = ttl
+        self.retry_ttl = retry_ttl
+        self._lock = threading.Lock()
+        self._rules = {}  # origin -> (RobotFileParser or None, expires)
+        self._origin_locks = {}
+
+    def allowed(self, url):
+        parser = self.rules(url)
+        return parser is None or parser.can_fetch(self.user_agent, url)
+
+    def rules(self, url):
+        """The parsed robots.txt for url's origin, or None when everything is allowed"""
+        parsed = urlparse(url)
+        origin = f"{parsed.scheme}://{parsed.netloc.lower()}"
+        with self._lock:
+            rules = self._rules.get(origin)
+            if rules and rules[1] > time.monotonic():
+                return rules[0]
+            origin_lock = self._origin_locks.setdefault(origin, threading.Lock())
+        # One fetch per origin; other threads wait for its result
+        with origin_lock:
+            with self._lock:
+                rules = self._rules.get(origin)
+                if rules and rules[1] > time.monotonic():
+                    return rules[0]
+            parser, ttl = self._load(origin, parsed.netloc.lower())
+            with self._lock:
+                self._rules[origin] = (parser, time.monotonic() + ttl)
+            return parser
+
+    def _load(self, origin, host):
+        robots_url = f"{origin}/robots.txt"
+        try:
+            response = self.fetch(robots_url)
+        except Exception as e:
+            click.echo(f"Could not fetch {robots_url}, allowing all paths for now: {e}")
+            return None, self.retry_ttl
+        if response.status_code >= 500:
+            click.echo(f"Could not fetch {robots_url} (HTTP {response.status_code}), allowing all paths for now")
+            return None, self.retry_ttl
+        if response.status_code >= 400:
+            self.rate_limiter.set_host_rate(host, None)
+            return None, self.ttl
+
+        lines = response.text.splitlines()
+        parser = RobotFileParser(robots_url)
+        parser.parse(lines)
+        rates = []
+        delay = robots_crawl_delay(lines, self.user_agent)
+        if delay:
+            rates.append(1.0 / delay)
+        request_rate = parser.request_rate(self.user_agent)
+        if request_rate and request_rate.requests and request_rate.seconds:
+            rates.append(request_rate.requests / request_rate.seconds)
+        rate = min(rates) if rates else None
+        if rate is not None and rate != self.rate_limiter.host_rate(host):
+            click.echo(f"Crawling {host} at {rate:g} requests/s as its robots.txt asks")
+        self.rate_limiter.set_host_rate(host, rate)
+        return parser, self.ttl
+
+def write_atomic(path, data):
+    """Write bytes or text to path via a temporary file so readers never see a partial file"""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    with open(tmp_path, mode, **({} if mode == 'wb' else {'encoding': 'utf-8'})) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class HttpCache:
+    """Persistent on-disk response cache with LRU eviction and conditional revalidation
+
+    Each entry is a body file plus a JSON metadata file holding the validators
+    (ETag / Last-Modified) used to revalidate it with a conditional GET.
+    """
+
+    # Headers that describe the wire encoding rather than the stored body
+    SKIP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+    def __init__(self, directory, max_bytes=500 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        folder = self.directory / key[:2]
+        return folder / f"{key}.body", folder / f"{key}.json"
+
+    def get(self, url):
+        """Return (metadata, body) for a cached URL, or None"""
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        # Touch the entry so eviction sees it as recently used
+        try:
+            os.utime(body_path)
+        except OSError:
+            pass
+        return meta, body
+
+    def is_fresh(self, meta):
+        """True if Cache-Control max-age says the entry can be used without revalidating"""
+        cache_control = CaseInsensitiveDict(meta['headers']).get('Cache-Control', '')
+        if 'no-cache' in cache_control:
+            return False
+        match = re.search(r'max-age=(\d+)', cache_control)
+        return bool(match) and time.time() - meta['stored'] < int(match.group(1))
+
+    def conditional_headers(self, meta):
+        stored = CaseInsensitiveDict(meta['headers'])
+        headers = {}
+        if 'ETag' in stored:
+            headers['If-None-Match'] = stored['ETag']
+        if 'Last-Modified' in stored:
+            headers['If-Modified-Since'] = stored['Last-Modified']
+        return headers
+
+    def store(self, url, response):
+        """Save a 200 response unless the origin forbids storing it"""
+        if response.status_code != 200 or 'no-store' in response.headers.get('Cache-Control', ''):
+            return
+        meta = {
+            'url': response.url,
+            'status': response.status_code,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() not in self.SKIP_HEADERS},
+            'stored': time.time(),
+        }
+        self._write(url, meta, response.content)
+
+    def refresh(self, url, meta, not_modified):
+        """Merge the headers of a 304 into a cached entry and restart its freshness clock"""
+        meta['headers'].update(
+            {k: v for k, v in not_modified.headers.items() if k.lower() not in self.SKIP_HEADERS}
+        )
+        meta['stored'] = time.time()
+        self._write(url, meta, None)
+
+    def _write(self, url, meta, body):
+        body_path, meta_path = self._paths(url)
+        body_path.parent.mkdir(exist_ok=True)
+        if body is not None:
+            old_size = body_path.stat().st_size if body_path.exists() else 0
+            write_atomic(body_path, body)
+        write_atomic(meta_path, json.dumps(meta))
+        if body is None:
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = sum(p.stat().st_size for p in self.directory.glob('*/*.body'))
+            else:
+                self._size += len(body) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Caller holds self._lock. Drop least recently used bodies until we are
+        # comfortably below the cap so eviction does not run on every write.
+        entries = []
+        for body_path in self.directory.glob('*/*.body'):
+            try:
+                stat = body_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, body_path))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, body_path in entries:
+            if self._size <= target:
+                break
+            for path in (body_path, body_path.with_suffix('.json')):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            self._size -= size
+
+class DeadlineExceeded(Exception):
+    """Raised when a request would start after the book's overall deadline"""
+
+class FetchError(Exception):
+    """A fetch that failed for good, classified as transient or permanent"""
+
+    def __init__(self, message, transient=False, status=None, attempts=1):
+        super().__init__(message)
+        self.transient = transient
+        self.status = status
+        self.attempts = attempts
+
+class CircuitOpenError(FetchError):
+    """A request refused locally because its host's circuit breaker has given up on it"""
+
+    def __init__(self, message):
+        super().__init__(message, transient=True)
+
+# Statuses worth retrying: timeouts, rate limiting and server-side failures
+TRANSIENT_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Statuses where servers commonly mishandle HEAD; the link is re-checked with GET
+HEAD_FALLBACK_STATUSES = {400, 403, 405, 406, 501}
+HTML_CONTENT_TYPES = {'text/html', 'application/xhtml+xml'}
+
+def same_site(url, other):
+    """Whether two URLs are on the same site, treating www. and subdomains of each other as one"""
+    host = (urlparse(url).hostname or '').lower().removeprefix('www.')
+    other_host = (urlparse(other).hostname or '').lower().removeprefix('www.')
+    return host == other_host or host.endswith(f".{other_host}") or other_host.endswith(f".{host}")
+
+def is_transient_error(error):
+    """True if an exception from a fetch is worth retrying"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in TRANSIENT_STATUSES or error.response.status_code >= 500
+    return isinstance(error, (requests.Timeout, requests.ConnectionError))
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, capped by a per-host retry budget
+
+    Each host may spend budget_floor retries plus budget_ratio retries per
+    request sent to it, so an origin that keeps failing quickly stops being
+    retried instead of receiving several times the normal traffic.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, budget_ratio=0.2, budget_floor=10):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_floor = budget_floor
+        self._lock = threading.Lock()
+        self._requests = {}  # host -> first attempts sent
+        self._retries = {}  # host -> retries spent
+
+    def record_request(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            self._requests[host] = self._requests.get(host, 0) + 1
+
+    def allow_retry(self, url):
+        """Spend one retry from the host's budget if any is left"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            budget = self.budget_floor + self.budget_ratio * self._requests.get(host, 0)
+            if self._retries.get(host, 0) >= budget:
+                return False
+            self._retries[host] = self._retries.get(host, 0) + 1
+            return True
+
+    def backoff(self, attempt):
+        """Seconds to wait before the retry following attempt number `attempt`"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+class CircuitBreaker:
+    """Per-host circuit breaker: closed, open, then half-open probes
+
+    A host's circuit opens after `failures` consecutive failures, or when at
+    least `failure_rate` of its last `window` requests failed. Failures are
+    timeouts, connection errors, 403 (blocked), 429 and 5xx; a 404 still
+    shows the host is up. While the circuit is open, requests to the host
+    wait. After open_seconds, one half-open probe is let through: success
+    closes the circuit, and failure reopens it for twice as long. before()
+    hands the probe a token to pass back to record(); while half-open, the
+    outcomes of other requests (sent before the circuit opened) are ignored.
+    Once a host has been failing for give_up_after seconds, requests to it
+    fail straight away with CircuitOpenError instead of waiting, and no more
+    probes are sent. give_up_after=0 aborts as soon as the circuit opens.
+    """
+
+    def __init__(self, failures=5, failure_rate=0.5, window=20, min_requests=10, open_seconds=30.0,
+                 max_open_seconds=300.0, give_up_after=600.0):
+        self.failures = failures
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.give_up_after = give_up_after
+        self._condition = threading.Condition()
+        self._hosts = {}  # host -> state dict
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {
+                'state': 'closed', 'consecutive': 0, 'recent': deque(maxlen=self.window),
+                'opened_at': 0.0, 'open_for': self.open_seconds, 'failing_since': None, 'probe': None,
+            }
+        return state
+
+    def state(self, host):
+        with self._condition:
+            return self._state(host)['state']
+
+    def before(self, url, deadline=None):
+        """Wait until a request to url's host may go out; raise CircuitOpenError once given up
+
+        Returns a probe token for the half-open probe, None for other requests.
+        """
+        host = urlparse(url).netloc.lower()
+        with self._condition:
+            while True:
+                state = self._state(host)
+                if state['state'] == 'closed':
+                    return None
+                now = time.monotonic()
+                give_up_at = state['failing_since'] + self.give_up_after
+                if now >= give_up_at:
+                    raise CircuitOpenError(f"Circuit open for {host}: giving up after repeated failures")
+                if state['state'] == 'open' and now >= state['opened_at'] + state['open_for']:
+                    state['state'] = 'half_open'
+                    state['probe'] = object()
+                    click.echo(f"Probing {host} to see if it has recovered")
+                    return state['probe']
+                wake = state['opened_at'] + state['open_for'] if state['state'] == 'open' else now + 1.0
+                wake = min(wake, give_up_at)
+                if deadline is not None:
+                    if now >= deadline:
+                        raise DeadlineExceeded("Book deadline exceeded")
+                    wake = min(wake, deadline)
+                self._condition.wait(max(0.0, wake - now))
+
+    def record(self, url, failed, probe=None):
+        """Report a request's outcome: True/False, or None when it says nothing about the host
+
+        probe is the token before() returned for this request, if any.
+        """
+        host = urlparse(url).netloc.lower()
+        with self._condition:
+            state = self._state(host)
+            if state['state'] == 'half_open':
+                if probe is None or probe is not state['probe']:
+                    return  # sent before the circuit opened; only the probe decides
+                state['probe'] = None
+                if failed is None:
+                    state['state'] = 'open'  # let the next request probe instead
+                elif failed:
+                    state['open_for'] = min(self.max_open_seconds, state['open_for'] * 2)
+                    self._open(host, state, "recovery probe failed")
+                else:
+                    click.echo(f"{host} recovered; circuit closed")
+                    state.update(state='closed', consecutive=0, open_for=self.open_seconds, failing_since=None)
+                    state['recent'].clear()
+                self._condition.notify_all()
+                return
+            if failed is None or state['state'] != 'closed':
+                return
+            state['recent'].append(failed)
+            state['consecutive'] = state['consecutive'] + 1 if failed else 0
+            recent = state['recent']
+            if state['consecutive'] >= self.failures:
+                self._open(host, state, f"{state['consecutive']} consecutive failures")
+            elif len(recent) >= self.min_requests and sum(recent) / len(recent) >= self.failure_rate:
+                self._open(host, state, f"{sum(recent)} of its last {len(recent)} requests failed")
+
+    def _open(self, host, state, reason):
+        # Caller holds self._condition
+        now = time.monotonic()
+        state.update(state='open', opened_at=now)
+        if state['failing_since'] is None:
+            state['failing_since'] = now
+        if self.give_up_after and now - state['failing_since'] < self.give_up_after:
+            click.echo(f"Circuit open for {host} ({reason}); pausing its requests for {state['open_for']:g}s")
+        else:
+            click.echo(f"Circuit open for {host} ({reason}); failing its remaining requests")
+
+def is_host_failure(error):
+    """Whether a fetch exception suggests the host is down or blocking us (for the circuit breaker)"""
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status == 403 or is_transient_error(error)
+
+# Seconds spent opening connections during the current request on this thread
+_connect_timing = threading.local()
+
+def _time_connects(conn):
+    """Wrap a new connection's connect() so its DNS/TCP/TLS setup time is recorded"""
+    connect = conn.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            _connect_timing.seconds = getattr(_connect_timing, 'seconds', 0.0) + time.perf_counter() - started
+
+    conn.connect = timed_connect
+    return conn
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that counts requests and newly opened connections per host
+
+    Requests minus new connections is the number served over a kept-alive
+    connection, which shows whether pooling is actually working.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.connection_stats = {}  # host -> {'requests': n, 'new_connections': n}
+        self._stats_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def _count(self, host, key):
+        with self._stats_lock:
+            stats = self.connection_stats.setdefault(host, {'requests': 0, 'new_connections': 0})
+            stats[key] += 1
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                adapter._count(self.host, 'new_connections')
+                return _time_connects(super()._new_conn())
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                adapter._count(self.host, 'new_connections')
+                return _time_connects(super()._new_conn())
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        self._count(urlparse(request.url).hostname, 'requests')
+        return super().send(request, **kwargs)
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+class MetricsRecorder:
+    """Request hook that keeps every request record and aggregates them per host
+
+    Timings are in seconds: wait is time queued in our own rate limiter,
+    connect covers DNS, TCP and TLS for newly opened connections, ttfb is the
+    remaining time until response headers arrive, and transfer is reading and
+    decompressing the body. wire_bytes is what came over the socket and
+    decoded_bytes the body after decompression.
+    """
+
+    PHASES = ('wait', 'connect', 'ttfb', 'transfer', 'total')
+
+    def __init__(self, path=None):
+        self.path = path
+        self.extraction = None  # ExtractionEngine.stats(), when available
+        self._lock = threading.Lock()
+        self.records = []
+
+    def __call__(self, record):
+        with self._lock:
+            self.records.append(dict(record))
+
+    def summary(self):
+        """Per-host counts, byte totals, cache outcomes and phase timings (total/mean/p95/max)"""
+        with self._lock:
+            records = list(self.records)
+        by_host = {}
+        for record in records:
+            by_host.setdefault(record['host'], []).append(record)
+
+        summary = {}
+        for host, host_records in by_host.items():
+            stats = {
+                'requests': len(host_records),
+                'errors': sum(1 for r in host_records if r['error']),
+                'statuses': {},
+                'cache': {},
+                'wire_bytes': sum(r['wire_bytes'] for r in host_records),
+                'decoded_bytes': sum(r['decoded_bytes'] for r in host_records),
+                'hedged': sum(1 for r in host_records if r.get('hedged')),
+            }
+            for record in host_records:
+                stats['statuses'][str(record['status'])] = stats['statuses'].get(str(record['status']), 0) + 1
+                stats['cache'][str(record['cache'])] = stats['cache'].get(str(record['cache']), 0) + 1
+            for phase in self.PHASES:
+                values = [r[phase] for r in host_records]
+                stats[phase] = {
+                    'total': sum(values),
+                    'mean': sum(values) / len(values),
+                    'p95': percentile(values, 0.95),
+                    'max': max(values),
+                }
+            summary[host] = stats
+        return summary
+
+    def to_dict(self):
+        data = {'hosts': self.summary(), 'requests': list(self.records)}
+        if self.extraction is not None:
+            data['extraction'] = self.extraction
+        return data
+
+    def write(self, path=None):
+        """Export everything as JSON to path (or the path given at construction)"""
+        path = path or self.path
+        if path:
+            write_atomic(path, json.dumps(self.to_dict(), indent=2))
+
+class HedgePolicy:
+    """Decides when a slow request gets a second, hedged copy
+
+    A request is hedged once it has run longer than its host's p95 latency
+    over recent requests (and at least min_delay). Hedges are capped at
+    budget_ratio of the host's requests plus budget_floor, and each one also
+    needs a rate-limiter token that is free right now, so hedging never
+    pushes a host past its politeness budget.
+    """
+
+    def __init__(self, budget_ratio=0.05, budget_floor=2, min_samples=20, window=200, min_delay=0.25):
+        self.budget_ratio = budget_ratio
+        self.budget_floor = budget_floor
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._latencies = {}  # host -> deque of recent request latencies
+        self._counts = {}  # host -> [requests, hedges]
+        self.stats = {'hedged': 0, 'won': 0}
+
+    def threshold(self, host):
+        """Seconds to wait before hedging a request to host, or None while there is too little history"""
+        with self._lock:
+            latencies = list(self._latencies.get(host, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, percentile(latencies, 0.95))
+
+    def observe(self, host, latency):
+        with self._lock:
+            self._latencies.setdefault(host, deque(maxlen=self.window)).append(latency)
+            self._counts.setdefault(host, [0, 0])[0] += 1
+
+    def try_start(self, host, acquire_token):
+        """Claim a hedge for host if its budget allows and acquire_token() succeeds"""
+        with self._lock:
+            counts = self._counts.setdefault(host, [0, 0])
+            if counts[1] >= self.budget_floor + self.budget_ratio * counts[0] or not acquire_token():
+                return False
+            counts[1] += 1
+            self.stats['hedged'] += 1
+            return True
+
+    def record_win(self):
+        with self._lock:
+            self.stats['won'] += 1
+
+def _close_response(future):
+    # Done-callback for the losing side of a hedge
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
+
+def declared_charset(response):
+    """The charset the Content-Type header names, or None so the page is sniffed
+
+    Unlike response.encoding, this does not fall back to ISO-8859-1 for
+    text/html without a charset.
+    """
+    match = re.search(r'charset\s*=\s*["\']?([^\s;"\']+)', response.headers.get('Content-Type', ''), re.IGNORECASE)
+    return match.group(1) if match else None
+
+def cached_response(meta, body):
+    """Build a requests.Response from a cache entry"""
+    response = requests.Response()
+    response.status_code = meta['status']
+    response.headers = CaseInsensitiveDict(meta['headers'])
+    response.url = meta['url']
+    response._content = body
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.from_cache = True
+    return response
+
+class DownloadJournal:
+    """JSON manifest recording the download state of every chapter slot
+
+    A chapter only counts as done when the journal says so and the file on
+    disk still matches the recorded size and hash, so failed or truncated
+    chapters are retried on the next run.
+
+    Each record is appended as one JSON line to a log beside the manifest,
+    so a long book does not rewrite the whole journal per chapter. close()
+    folds the log back into the manifest; a log left behind by an
+    interrupted run is replayed when the journal is next opened.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.log_path = self.path.with_name(self.path.name + '.log')
+        self._lock = threading.Lock()
+        self._log = None
+        self.entries = {}  # chapter number (as str) -> entry dict
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f).get('chapters', {})
+            except (OSError, ValueError) as e:
+                click.echo(f"Ignoring unreadable journal {self.path}: {e}")
+        if self.log_path.exists():
+            self._replay()
+            self.close()
+
+    def _replay(self):
+        try:
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        index, entry = json.loads(line)
+                    except ValueError:
+                        break  # the last write of a run that was cut short
+                    self.entries[index] = entry
+        except OSError as e:
+            click.echo(f"Ignoring unreadable journal log {self.log_path}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Write the full manifest and drop the log of records appended since"""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            if self.log_path.exists():
+                write_atomic(self.path, json.dumps({'chapters': self.entries}, indent=1))
+                self.log_path.unlink()
+
+    def is_complete(self, index, url, chapter_file):
+        entry = self.entries.get(str(index))
+        if not entry or entry['status'] != 'done' or entry['url'] != url:
+            return False
+        try:
+            data = Path(chapter_file).read_bytes()
+        except OSError:
+            return False
+        return len(data) == entry['bytes'] and hashlib.sha256(data).hexdigest() == entry['sha256']
+
+    def failed(self):
+        """(index, url) pairs of chapters whose last attempt failed"""
+        return sorted(
+            (int(index), entry['url']) for index, entry in self.entries.items() if entry['status'] == 'failed'
+        )
+
+    def record(self, index, url, chapter_file, data=None, elapsed=0.0, error=None, attempts=1, transient=False):
+        """Record a download; data is the bytes written, or None if the chapter failed"""
+        with self._lock:
+            entry = self.entries.get(str(index))
+            if entry and entry['url'] == url:
+                attempts += entry['attempts']
+            entry = self.entries[str(index)] = {
+                'url': url,
+                'file': Path(chapter_file).name,
+                'status': 'done' if data is not None else 'failed',
+                'bytes': len(data) if data is not None else 0,
+                'sha256': hashlib.sha256(data).hexdigest() if data is not None else None,
+                'attempts': attempts,
+                'elapsed': round(elapsed, 3),
+                'updated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'error': error,
+                'transient': transient if data is None else None,
+            }
+            if self._log is None:
+                self._log = open(self.log_path, 'a', encoding='utf-8')
+            self._log.write(json.dumps([str(index), entry]) + '\n')
+            self._log.flush()
+
+class ChapterResult:
+    """Outcome of fetching one chapter: its markdown and HTML fragment, or a classified error"""
+
+    def __init__(self, url, content="", error=None, transient=False, status=None, attempts=1, elapsed=0.0, html=""):
+        self.url = url
+        self.content = content
+        self.html = html
+        self.error = error
+        self.transient = transient
+        self.status = status
+        self.attempts = attempts
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @classmethod
+    def from_content(cls, url, content, attempts=1, html=""):
+        if not content:
+            return cls(url, error="No content extracted", attempts=attempts)
+        return cls(url, content, attempts=attempts, html=html)
+
+    @classmethod
+    def from_error(cls, url, error):
+        if isinstance(error, FetchError):
+            return cls(url, error=str(error), transient=error.transient, status=error.status, attempts=error.attempts)
+        return cls(url, error=str(error), transient=isinstance(error, DeadlineExceeded))
+
+def _class_xpath(name):
+    return f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]"
+
+# Common content containers, most specific first
+CONTENT_XPATHS = [
+    _class_xpath('entry-content'),
+    _class_xpath('post-content'),
+    _class_xpath('chapter-content'),
+    _class_xpath('content'),
+    '//article',
+    _class_xpath('text-content'),
+    '//*[contains(@class, "content")]',
+    '//main',
+    _class_xpath('post'),
+    _class_xpath('entry'),
+]
+
+def _text_stats(root):
+    """Text length, link text length and tag count of every element's subtree, in one pass
+
+    Keeps running totals while walking the tree once; an element's figures
+    are the difference between the totals at its end and at its start, so
+    no subtree is walked again the way text_content() on each candidate does.
+    """
+    stats = {}
+    starts = []
+    text = links = tags = in_link = 0
+    for event, element in etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        if event in ('comment', 'pi'):
+            length = len(element.tail or '')  # their own text is not page text, but the tail is
+        elif event == 'start':
+            starts.append((text, links, tags))
+            tags += 1
+            if element.tag == 'a':
+                in_link += 1
+            length = len(element.text or '')
+        else:
+            started_text, started_links, started_tags = starts.pop()
+            stats[element] = (text - started_text, links - started_links, tags - started_tags)
+            if element.tag == 'a':
+                in_link -= 1
+            length = len(element.tail or '')  # the tail belongs to the parent
+        text += length
+        if in_link:
+            links += length
+    return stats
+
+def _content_score(stats):
+    # Text outside links, discounted by link density; fewer tags wins a tie,
+    # so a wrapper holding nothing but the content loses to the content itself
+    text, links, tags = stats
+    if not text:
+        return 0.0, 0
+    return (text - links) * (1 - links / text), -tags
+
+def _extract_content_fallback(root, url):
+    """Fallback content extraction on the parsed page"""
+    # Remove unwanted elements
+    for element in root.xpath('//script|//style|//nav|//header|//footer|//aside|//advertisement'):
+        element.drop_tree()
+
+    # Try common content selectors
+    content_element = None
+    for xpath in CONTENT_XPATHS:
+        elements = root.xpath(xpath)
+        if elements:
+            # Find the one with the most text outside links
+            stats = _text_stats(root) if len(elements) > 1 else None
+            content_element = max(elements, key=lambda x: _content_score(stats[x])) if stats else elements[0]
+            break
+
+    # If no specific content found, pick the block with the best text density
+    if content_element is None:
+        all_elements = root.xpath('//div|//section|//article')
+        if all_elements:
+            stats = _text_stats(root)
+            content_element = max(all_elements, key=lambda x: _content_score(stats[x]))
+
+    # Last resort: use body content
+    if content_element is None:
+        content_element = root.find('body')
+        if content_element is None:
+            content_element = root
+
+    # Remove navigation and menu elements within content
+    for unwanted in content_element.xpath('.//nav|.//menu'):
+        unwanted.drop_tree()
+    return content_element
+
+class _Article:
+    # What _TreeDocument.summary() returns: the article element, with the
+    # length readability expects of its serialized HTML for its retry check
+    def __init__(self, element):
+        self.element = element
+
+    def __bool__(self):
+        return True
+
+    def __len__(self):
+        return len(lxml.html.tostring(self.element, encoding='unicode'))
+
+class _TreeDocument(Document):
+    """readability Document that works on an already-parsed tree
+
+    Plain readability parses the page from a string and serializes the
+    article back into HTML for the next stage to parse again; here summary()
+    returns the article element itself. readability's cleaner works on a
+    copy, so the original tree is still intact for the fallback extractor.
+    """
+
+    def get_clean_html(self):
+        return _Article(self.html)
+
+def parse_html(data, encoding=None):
+    """Parse page bytes (or text) into an lxml tree once; None if the page is empty
+
+    Bytes are handed to libxml2 with the HTTP charset (or a sniffed one) so
+    the page is not decoded into a Python string first.
+    """
+    if not data.strip():
+        return None
+    try:
+        if isinstance(data, bytes):
+            encoding = encoding or UnicodeDammit(data, is_html=True).original_encoding
+            if encoding:
+                try:
+                    return lxml.html.document_fromstring(data, parser=lxml.html.HTMLParser(encoding=encoding))
+                except LookupError:  # an encoding libxml2 does not know
+                    pass
+            data = decode_html(data, encoding)
+        # lxml refuses text that still carries an XML encoding declaration
+        return lxml.html.document_fromstring(re.sub(r'^\s*<\?xml[^>]*\?>', '', data))
+    except etree.ParserError:
+        return None
+
+# Bump whenever extraction output changes so cached chapters are re-extracted
+EXTRACTOR_VERSION = 2
+
+# Elements whose content never belongs in the markdown
+MARKDOWN_SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'head'}
+MARKDOWN_BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'main', 'header', 'footer', 'aside', 'nav', 'figure', 'figcaption',
+    'dl', 'dt', 'dd', 'address', 'body', 'html', 'center', 'details', 'summary', 'form', 'fieldset',
+}
+
+def _md_text(text):
+    return re.sub(r'\s+', ' ', text).replace('*', r'\*').replace('_', r'\_')
+
+def _md_wrap(content, marker):
+    # Keep surrounding whitespace outside the markers, as "** bold**" is not bold
+    stripped = content.strip()
+    if not stripped:
+        return ' ' if content else ''
+    prefix = ' ' if content[:1].isspace() else ''
+    suffix = ' ' if content[-1:].isspace() else ''
+    return f"{prefix}{marker}{stripped}{marker}{suffix}"
+
+def _md_children(element, depth):
+    parts = [_md_text(element.text)] if element.text else []
+    for child in element:
+        parts.append(_md_element(child, depth))
+        if child.tail:
+            parts.append(_md_text(child.tail))
+    return ''.join(parts)
+
+def _md_list(element, ordered, depth):
+    try:
+        number = int(element.get('start', 1))
+    except ValueError:
+        number = 1
+    items = []
+    for child in element:
+        tag = child.tag.lower() if isinstance(child.tag, str) else None
+        if tag in ('ul', 'ol') and items:
+            # A list nested directly in a list belongs to the item before it
+            nested = _md_list(child, tag == 'ol', depth + 1).strip('\n')
+            items[-1] += '\n' + '\n'.join('    ' + line if line else '' for line in nested.split('\n'))
+            continue
+        if tag != 'li':
+            continue
+        marker = f"{number}. " if ordered else "- "
+        number += 1
+        lines = _md_children(child, depth + 1).strip().split('\n')
+        items.append(marker + lines[0] + ''.join('\n' + ('    ' + line if line.strip() else '') for line in lines[1:]))
+    if not items:
+        return ''
+    return '\n\n' + '\n'.join(items) + '\n\n'
+
+def _md_table(element):
+    rows = []
+    for row in element.iter('tr'):
+        cells = [
+            re.sub(r'\s+', ' ', _md_children(cell, 0)).strip().replace('|', r'\|')
+            for cell in row if isinstance(cell.tag, str) and cell.tag.lower() in ('td', 'th')
+        ]
+        if cells:
+            rows.append(cells)
+    if not rows:
+        return ''
+    width = max(len(cells) for cells in rows)
+    rows = [cells + [''] * (width - len(cells)) for cells in rows]
+    lines = [f"| {' | '.join(rows[0])} |", f"| {' | '.join(['---'] * width)} |"]
+    lines.extend(f"| {' | '.join(cells)} |" for cells in rows[1:])
+    return '\n\n' + '\n'.join(lines) + '\n\n'
+
+def _md_element(element, depth=0):
+    if not isinstance(element.tag, str):
+        return ''  # comments and processing instructions
+    tag = element.tag.lower()
+    if tag in MARKDOWN_SKIP_TAGS:
+        return ''
+    if tag == 'br':
+        return '  \n'
+    if tag == 'hr':
+        return '\n\n---\n\n'
+    if tag == 'pre':
+        return f"\n\n```\n{element.text_content().strip(chr(10))}\n```\n\n"
+    if tag in ('code', 'kbd', 'samp', 'tt'):
+        code = element.text_content()
+        fence = '``' if '`' in code else '`'
+        return f"{fence}{code}{fence}" if code else ''
+    if tag == 'img':
+        src = element.get('src')
+        alt = element.get('alt', '')
+        title = f' "{element.get("title")}"' if element.get('title') else ''
+        return f"![{alt}]({src}{title})" if src else alt
+    if tag in ('ul', 'ol'):
+        return _md_list(element, tag == 'ol', depth)
+    if tag == 'table':
+        return _md_table(element)
+
+    content = _md_children(element, depth)
+    if tag in ('b', 'strong'):
+        return _md_wrap(content, '**')
+    if tag in ('i', 'em'):
+        return _md_wrap(content, '*')
+    if tag in ('s', 'del', 'strike'):
+        return _md_wrap(content, '~~')
+    if tag == 'a':
+        href = element.get('href')
+        text = re.sub(r'\s*\n\s*', ' ', content).strip()
+        if not href or not text:
+            return content
+        title = f' "{element.get("title")}"' if element.get('title') else ''
+        return _md_wrap(content, '').replace(text, f"[{text}]({href}{title})", 1)
+    if len(tag) == 2 and tag[0] == 'h' and tag[1] in '123456':
+        text = re.sub(r'\s*\n\s*', ' ', content).strip()
+        return f"\n\n{'#' * int(tag[1])} {text}\n\n" if text else ''
+    if tag == 'blockquote':
+        lines = re.sub(r'\n\s*\n', '\n\n', content.strip()).split('\n')
+        return '\n\n' + '\n'.join(f"> {line}" if line.strip() else '>' for line in lines) + '\n\n'
+    if tag in MARKDOWN_BLOCK_TAGS or tag == 'li':
+        return f"\n\n{content.strip()}\n\n"
+    return content
+
+def html_to_markdown(element):
+    """Convert an lxml element to markdown (ATX headings, '-' bullets) without reparsing it"""
+    lines = _md_element(element).split('\n')
+    # Drop trailing spaces except the two that mark a line break before more text
+    for i, line in enumerate(lines):
+        stripped = line.rstrip()
+        keep_break = line.endswith('  ') and stripped and i + 1 < len(lines) and lines[i + 1].strip()
+        lines[i] = stripped + '  ' if keep_break else stripped
+    return '\n'.join(lines)
+
+# Markup that never belongs in a stored chapter fragment, and the attributes kept per tag
+FRAGMENT_DROP_TAGS = (
+    'script', 'style', 'noscript', 'template', 'iframe', 'object', 'embed', 'form', 'input', 'button',
+    'select', 'textarea', 'link', 'meta',
+)
+FRAGMENT_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan'},
+    'ol': {'start'},
+}
+
+def html_fragment(element):
+    """Sanitized HTML for an extracted article: no scripts, forms, comments or styling attributes
+
+    Modifies the element in place, so call it after converting to markdown.
+    """
+    for node in element.xpath('.//comment()|.//processing-instruction()'):
+        node.drop_tree()
+    for node in element.xpath('|'.join(f'.//{tag}' for tag in FRAGMENT_DROP_TAGS)):
+        node.drop_tree()
+    for node in element.iter():
+        allowed = FRAGMENT_ATTRIBUTES.get(node.tag, ())
+        for name, value in list(node.attrib.items()):
+            if name not in allowed or value.strip().lower().startswith('javascript:'):
+                del node.attrib[name]
+
+    if element.tag == 'html' and element.find('body') is not None:
+        element = element.find('body')
+    if element.tag in ('html', 'body'):
+        return escape(element.text or '') + ''.join(lxml.html.tostring(child, encoding='unicode') for child in element)
+    return lxml.html.tostring(element, encoding='unicode', with_tail=False)
+
+# Blocks compared across chapters when looking for repeated boilerplate
+BOILERPLATE_BLOCK_TAGS = {
+    'p', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'dt', 'dd', 'figcaption', 'div', 'table',
+}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+# Shorter repeated blocks ("What?", "Yes.") are only dropped at a chapter's edges
+BOILERPLATE_MIN_CHARS = 40
+
+def _leaf_blocks(root):
+    """Block elements of a fragment that contain no other block, in document order"""
+    blocks = [el for el in root.iter() if el.tag in BOILERPLATE_BLOCK_TAGS and el is not root]
+    containers = set()
+    for block in blocks:
+        parent = block.getparent()
+        while parent is not None and parent is not root and parent not in containers:
+            containers.add(parent)
+            parent = parent.getparent()
+    return [block for block in blocks if block not in containers]
+
+def _block_hash(block):
+    """(hash of the block's normalized text, its length), with no hash for blocks without words"""
+    text = ' '.join(block.text_content().split()).lower()
+    if not re.search(r'\w', text):
+        return None, len(text)  # scene breaks and other pure punctuation are not boilerplate
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), len(text)
+
+def _edge_blocks(blocks, repeated):
+    """Indexes of repeated blocks in the runs that open and close a chapter, looking past headings"""
+    edges = set()
+    for order in (range(len(blocks)), reversed(range(len(blocks)))):
+        for i in order:
+            if repeated[i]:
+                edges.add(i)
+            elif blocks[i][0].tag not in HEADING_TAGS:
+                break
+    return edges
+
+def remove_boilerplate(chapters, threshold=0.5, min_chapters=3):
+    """Drop blocks that recur in more than threshold of a book's chapter fragments
+
+    Returns the cleaned fragments and the number of bytes removed. Each
+    chapter is parsed once; block hashes are counted once per chapter and a
+    second pass over the same hashes removes the common ones. Blocks shorter
+    than BOILERPLATE_MIN_CHARS go only from the start and end of a chapter,
+    where site chrome sits, since mid-chapter they are likely dialogue.
+    Chapters with nothing to remove are returned unchanged.
+    """
+    if not threshold or len(chapters) < min_chapters:
+        return list(chapters), 0
+    parsed = []
+    counts = {}
+    for chapter in chapters:
+        root = lxml.html.fragment_fromstring(chapter, create_parent='div')
+        blocks = [(block, *_block_hash(block)) for block in _leaf_blocks(root)]
+        for digest in {digest for _, digest, _ in blocks if digest}:
+            counts[digest] = counts.get(digest, 0) + 1
+        parsed.append((root, blocks))
+
+    limit = threshold * len(chapters)
+    cleaned = []
+    removed = 0
+    for chapter, (root, blocks) in zip(chapters, parsed):
+        repeated = [bool(digest) and counts[digest] > limit for _, digest, _ in blocks]
+        edges = _edge_blocks(blocks, repeated)
+        boilerplate = [
+            block for i, (block, _, length) in enumerate(blocks)
+            if repeated[i] and (length >= BOILERPLATE_MIN_CHARS or i in edges)
+        ]
+        if not boilerplate:
+            cleaned.append(chapter)
+            continue
+        for block in boilerplate:
+            removed += len(lxml.html.tostring(block, encoding='unicode', with_tail=False).encode('utf-8'))
+            block.drop_tree()
+        cleaned.append(
+            escape(root.text or '') + ''.join(lxml.html.tostring(child, encoding='unicode') for child in root)
+        )
+    return cleaned, removed
+
+# A learned selector must find at least this much text, and at least this
+# fraction of the smallest page share seen while learning, to be trusted
+SELECTOR_MIN_CHARS = 200
+SELECTOR_MIN_SHARE = 0.5
+
+def _text_length(element):
+    return len(' '.join(element.text_content().split()))
+
+def _selector_candidates(element):
+    """Template-stable XPaths for a content container: by id, then by tag and class"""
+    candidates = []
+    for attribute in ('id', 'class'):
+        value = element.get(attribute)
+        if value and value.strip() and '"' not in value:
+            tag = '*' if attribute == 'id' else element.tag
+            candidates.append(f'//{tag}[@{attribute}="{value}"]')
+    return candidates
+
+def _articles_agree(article, container):
+    """Whether readability's article and the fallback's container hold the same text"""
+    article_text = ' '.join(article.text_content().split())
+    container_text = ' '.join(container.text_content().split())
+    shorter, longer = sorted((len(article_text), len(container_text)))
+    return shorter >= SELECTOR_MIN_CHARS and shorter >= 0.9 * longer and article_text[:100] in container_text
+
+def _apply_selector(root, selector, page_length):
+    """The element a learned selector picks, if it passes the text-length sanity check
+
+    The tree is only modified once the check passes, so a page that fails
+    it reaches readability untouched.
+    """
+    elements = root.xpath(selector['xpath'])
+    if len(elements) != 1:
+        return None
+    element = elements[0]
+    unwanted = element.xpath('.//script|.//style|.//nav|.//menu|.//aside|.//advertisement')
+    found = set(unwanted)
+    # Leave out their text without dropping them yet; nested ones are already counted by their ancestor
+    outermost = [node for node in unwanted if not any(parent in found for parent in node.iterancestors())]
+    length = _text_length(element) - sum(_text_length(node) for node in outermost)
+    if length < SELECTOR_MIN_CHARS or length < SELECTOR_MIN_SHARE * selector['share'] * page_length:
+        return None
+    for node in outermost:
+        node.drop_tree()
+    return element
+
+def extract_chapter(root, url, selector=None, learn=False, outcome=None):
+    """Markdown and a sanitized HTML fragment for the chapter content of a parsed page
+
+    With a learned selector for the site the content container is taken
+    directly and readability only runs when it fails the sanity check. With
+    learn=True, containers that readability and the fallback agree on are
+    reported as selector candidates in the outcome dict.
+    """
+    if outcome is None:
+        outcome = {}
+    outcome.update(applied=None, candidates=[], share=0.0)
+    if root is None:
+        return "", ""
+    body = root.find('body')
+    page_length = _text_length(body if body is not None else root) if selector or learn else 0
+
+    article = None
+    if selector:
+        article = _apply_selector(root, selector, page_length)
+        outcome['applied'] = article is not None
+    if article is None:
+        # First try with readability
+        try:
+            article = _TreeDocument(root).summary().element
+        except Exception as readability_error:
+            click.echo(f"Readability failed, using fallback method: {readability_error}")
+            # Fallback: pick the content container from the same tree
+            article = _extract_content_fallback(root, url)
+        else:
+            if learn and page_length:
+                container = _extract_content_fallback(root, url)
+                if _articles_agree(article, container):
+                    outcome['candidates'] = [
+                        xpath for xpath in _selector_candidates(container) if len(root.xpath(xpath)) == 1
+                    ]
+                    outcome['share'] = _text_length(container) / page_length
+
+    markdown_content = html_to_markdown(article)
+
+    # Clean up the markdown
+    markdown_content = re.sub(r'\n\s*\n\s*\n', '\n\n', markdown_content)
+    return markdown_content.strip(), html_fragment(article)
+
+def extract_markdown(html_content, url, encoding=None):
+    """Turn a chapter page (bytes or text) into cleaned-up markdown"""
+    return extract_chapter(parse_html(html_content, encoding), url)[0]
+
+def decode_html(data, encoding=None):
+    """Decode page bytes using the HTTP charset if known, otherwise sniff it"""
+    if isinstance(data, str):
+        return data
+    if encoding:
+        return data.decode(encoding, errors='replace')
+    return UnicodeDammit(data, is_html=True).unicode_markup or data.decode('utf-8', errors='replace')
+
+def _init_extraction_worker():
+    # Run one tiny extraction so readability and lxml are imported
+    # and their regexes compiled before the first real chapter arrives
+    extract_markdown('<html><body><div><p>warm up</p></div></body></html>', 'about:blank')
+
+def _timed_extract(data, url, encoding, selector=None, learn=False):
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    root = parse_html(data, encoding)
+    parsed = time.perf_counter()
+    outcome = {}
+    content, html = extract_chapter(root, url, selector, learn, outcome)
+    return (
+        (content, html), time.perf_counter() - wall_started, time.process_time() - cpu_started,
+        parsed - wall_started, outcome
+    )
+
+class SiteSelectors:
+    """Content-container selectors learned per host and kept on disk as JSON
+
+    Chapters of one book share a page template. Once readability and the
+    fallback extractor agree on the same container (by id or class) for a
+    few pages of a host, later pages take that container directly. Pages
+    where it fails the text-length check go through readability, and a
+    selector that keeps failing is forgotten and learned again.
+    """
+
+    def __init__(self, path=None, confirmations=3, max_attempts=8, max_misses=3, version=EXTRACTOR_VERSION):
+        self.path = Path(path) if path else None
+        self.confirmations = confirmations
+        self.max_attempts = max_attempts
+        self.max_misses = max_misses
+        self.version = version
+        self._lock = threading.Lock()
+        self._learned = {}
+        self._learning = {}
+        self.stats = {'hits': 0, 'misses': 0, 'learned': 0, 'forgotten': 0}
+        if self.path and self.path.exists():
+            try:
+                saved = json.loads(self.path.read_text())
+            except (OSError, ValueError):
+                saved = {}
+            if saved.get('version') == version:
+                self._learned = saved.get('hosts', {})
+
+    def plan(self, url):
+        """(selector or None, whether to report candidates) for extracting a page of url"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            selector = self._learned.get(host)
+            if selector:
+                return selector, False
+            state = self._learning.setdefault(host, {'attempts': 0, 'votes': {}, 'share': {}, 'misses': 0})
+            return None, state['attempts'] < self.max_attempts
+
+    def observe(self, url, outcome):
+        """Learn from one extraction's outcome (see extract_chapter)"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if outcome.get('applied') is not None:
+                self._observe_applied(host, outcome['applied'])
+                return
+            state = self._learning.get(host)
+            if state is None or host in self._learned or state['attempts'] >= self.max_attempts:
+                return
+            state['attempts'] += 1
+            for xpath in outcome.get('candidates', ()):
+                state['votes'][xpath] = state['votes'].get(xpath, 0) + 1
+                state['share'][xpath] = min(state['share'].get(xpath, 1.0), outcome['share'])
+                if state['votes'][xpath] >= self.confirmations:
+                    self._learned[host] = {'xpath': xpath, 'share': state['share'][xpath], 'misses': 0}
+                    self._learning.pop(host, None)
+                    self.stats['learned'] += 1
+                    click.echo(f"{host}: learned content selector {xpath}")
+                    self._save()
+                    return
+
+    def _observe_applied(self, host, applied):
+        selector = self._learned.get(host)
+        if selector is None:
+            return
+        if applied:
+            self.stats['hits'] += 1
+            selector['misses'] = 0
+            return
+        self.stats['misses'] += 1
+        selector['misses'] += 1
+        if selector['misses'] >= self.max_misses:
+            del self._learned[host]
+            self.stats['forgotten'] += 1
+            click.echo(f"{host}: content selector {selector['xpath']} stopped matching, learning again")
+            self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+        hosts = {host: {'xpath': s['xpath'], 'share': s['share'], 'misses': 0} for host, s in self._learned.items()}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(self.path, json.dumps({'version': self.version, 'hosts': hosts}, indent=2).encode('utf-8'))
+
+class ExtractionEngine:
+    """Turn raw chapter HTML into markdown on a pool of pre-warmed worker processes
+
+    Readability and markdown conversion hold the GIL, so threads cannot spread this
+    work across cores. workers=0 extracts inline on the calling thread. With
+    selectors (a SiteSelectors), workers report selector candidates and the
+    parent learns from them, then hands learned selectors to later pages.
+    """
+
+    def __init__(self, workers=None, selectors=None):
+        self.workers = (os.cpu_count() or 1) if workers is None else max(0, workers)
+        self.selectors = selectors
+        self._executor = None
+        if self.workers:
+            # forkserver avoids forking a parent that already runs fetch threads
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context, initializer=_init_extraction_worker
+            )
+            wait([self._executor.submit(int) for _ in range(self.workers)])
+        self._lock = threading.Lock()
+        self._stats = {
+            'tasks': 0, 'failures': 0, 'bytes': 0, 'wall': 0.0, 'cpu': 0.0, 'parse': 0.0, 'max_wall': 0.0, 'queued': 0.0
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+
+    def submit(self, data, url, encoding=None):
+        """Schedule extraction of page bytes (or text) and return a Future for (markdown, html fragment)"""
+        submitted = time.perf_counter()
+        selector, learn = self.selectors.plan(url) if self.selectors else (None, False)
+        if self._executor is None:
+            future = Future()
+            try:
+                timed = _timed_extract(data, url, encoding, selector, learn)
+            except Exception as e:
+                self._record(None, len(data), 0.0)
+                future.set_exception(e)
+            else:
+                self._record(timed, len(data), 0.0, url)
+                future.set_result(timed[0])
+            return future
+
+        result = Future()
+
+        def done(f):
+            try:
+                timed = f.result()
+            except Exception as e:
+                self._record(None, len(data), 0.0)
+                result.set_exception(e)
+            else:
+                self._record(timed, len(data), time.perf_counter() - submitted - timed[1], url)
+                result.set_result(timed[0])
+
+        self._executor.submit(_timed_extract, data, url, encoding, selector, learn).add_done_callback(done)
+        return result
+
+    def extract(self, data, url, encoding=None):
+        return self.submit(data, url, encoding).result()
+
+    def _record(self, timed, size, queued, url=None):
+        with self._lock:
+            self._stats['tasks'] += 1
+            self._stats['bytes'] += size
+            self._stats['queued'] += max(0.0, queued)
+            if timed is None:
+                self._stats['failures'] += 1
+                return
+            self._stats['wall'] += timed[1]
+            self._stats['cpu'] += timed[2]
+            self._stats['parse'] += timed[3]
+            self._stats['max_wall'] = max(self._stats['max_wall'], timed[1])
+        if self.selectors:
+            self.selectors.observe(url, timed[4])
+
+    def stats(self):
+        """Aggregate timings: totals plus per-task means, in seconds"""
+        with self._lock:
+            stats = dict(self._stats, workers=self.workers)
+        done = max(1, stats['tasks'] - stats['failures'])
+        stats['mean_wall'] = stats['wall'] / done
+        stats['mean_cpu'] = stats['cpu'] / done
+        stats['mean_parse'] = stats['parse'] / done
+        stats['mean_queued'] = stats['queued'] / max(1, stats['tasks'])
+        if self.selectors:
+            stats['selectors'] = dict(self.selectors.stats)
+        return stats
+
+def normalize_url(url):
+    """Canonical form of a URL for cache keys
+
+    Lowercases scheme and host, drops default ports and fragments, and sorts
+    the query string so trivially different spellings share one entry.
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    if parsed.port and (scheme, parsed.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parsed.port}"
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return parsed._replace(scheme=scheme, netloc=host, path=parsed.path or '/', query=query, fragment='').geturl()
+
+class ChapterCache:
+    """Process-wide cache of extracted chapters shared by every caller
+
+    A byte-bounded in-memory LRU sits in front of a gzip-compressed disk tier.
+    Keys combine the normalized URL with EXTRACTOR_VERSION, so a change to the
+    extraction code never serves stale output.
+    """
+
+    def __init__(self, directory=None, memory_bytes=64 * 1024 * 1024, version=EXTRACTOR_VERSION):
+        self.directory = Path(directory) if directory else None
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory_bytes = memory_bytes
+        self.version = version
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (entry, size)
+        self._memory_size = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def key(self, url):
+        return hashlib.sha256(f"{self.version}:{normalize_url(url)}".encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key):
+        return self.directory / key[:2] / f"{key}.json.gz"
+
+    def get(self, url):
+        """Cached entry dict for url, or None"""
+        key = self.key(url)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return self._memory[key][0]
+        entry = None
+        if self.directory:
+            try:
+                entry = json.loads(gzip.decompress(self._disk_path(key).read_bytes()))
+            except (OSError, ValueError):
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, url, entry):
+        """Store an entry dict (e.g. {'url', 'content'}) in both tiers"""
+        key = self.key(url)
+        if self.directory:
+            path = self._disk_path(key)
+            path.parent.mkdir(exist_ok=True)
+            write_atomic(path, gzip.compress(json.dumps(entry).encode('utf-8')))
+        with self._lock:
+            self._remember(key, entry)
+
+    def __contains__(self, url):
+        key = self.key(url)
+        with self._lock:
+            if key in self._memory:
+                return True
+        return bool(self.directory) and self._disk_path(key).exists()
+
+    def summary(self):
+        """Entry counts and hit statistics for display"""
+        with self._lock:
+            summary = dict(self.stats, memory_entries=len(self._memory), memory_bytes=self._memory_size)
+        summary['disk_entries'] = len(list(self.directory.glob('*/*.json.gz'))) if self.directory else 0
+        return summary
+
+    def _remember(self, key, entry):
+        # Caller holds self._lock
+        size = sum(len(v) for v in entry.values() if isinstance(v, str))
+        if key in self._memory:
+            self._memory_size -= self._memory.pop(key)[1]
+        if size > self.memory_bytes:
+            return
+        self._memory[key] = (entry, size)
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_size -= evicted_size
+
+MANIFEST_NAME = 'manifest.json'
+
+class ChapterStore:
+    """Content-addressed store of extracted chapters, shared between books
+
+    Each distinct chapter body is kept once, gzip-compressed under its
+    SHA-256, and a URL index maps chapter URLs to the hash extracted for them.
+    Books reference chapters through a manifest listing hashes in order, so
+    rebuilds, reorders and mirrored books reuse the stored objects instead of
+    downloading and extracting them again.
+    """
+
+    def __init__(self, root, version=EXTRACTOR_VERSION):
+        self.root = Path(root)
+        self.version = version
+
+    @staticmethod
+    def content_hash(content):
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def path(self, digest):
+        return self.root / 'objects' / digest[:2] / f"{digest}.md.gz"
+
+    def html_path(self, digest):
+        return self.root / 'objects' / digest[:2] / f"{digest}.html.gz"
+
+    def _index_path(self, url):
+        key = hashlib.sha256(f"{self.version}:{normalize_url(url)}".encode('utf-8')).hexdigest()
+        return self.root / 'urls' / key[:2] / f"{key}.json"
+
+    def __contains__(self, digest):
+        return self.path(digest).exists()
+
+    def put(self, content, url=None, html=None):
+        """Store markdown (and its HTML fragment) once per distinct body, index it under url, return its hash"""
+        digest = self.content_hash(content)
+        path = self.path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(path, gzip.compress(content.encode('utf-8')))
+        if html and not self.html_path(digest).exists():
+            write_atomic(self.html_path(digest), gzip.compress(html.encode('utf-8')))
+        if url:
+            index_path = self._index_path(url)
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(index_path, json.dumps({'url': url, 'hash': digest}))
+        return digest
+
+    def lookup(self, url):
+        """Hash this extractor version produced for url, if its object is still stored"""
+        try:
+            digest = json.loads(self._index_path(url).read_text(encoding='utf-8'))['hash']
+        except (OSError, ValueError, KeyError):
+            return None
+        return digest if digest in self else None
+
+    def read(self, digest):
+        return gzip.decompress(self.path(digest).read_bytes()).decode('utf-8')
+
+    def read_html(self, digest):
+        """The chapter's HTML fragment, or None if only markdown was stored"""
+        try:
+            return gzip.decompress(self.html_path(digest).read_bytes()).decode('utf-8')
+        except OSError:
+            return None
+
+    def write_manifest(self, path, urls):
+        """Write a book manifest referencing each chapter's hash in order (None if not stored)"""
+        chapters = [{'index': i, 'url': url, 'hash': self.lookup(url)} for i, url in enumerate(urls, 1)]
+        manifest = {'store': str(self.root.resolve()), 'version': self.version, 'chapters': chapters}
+        write_atomic(path, json.dumps(manifest, indent=1))
+        return chapters
+
+    @classmethod
+    def read_manifest(cls, path):
+        """(store, chapter entries) for a manifest written by write_manifest"""
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return cls(manifest['store'], manifest.get('version', EXTRACTOR_VERSION)), manifest['chapters']
+
+# Query parameters and path forms that carry a table-of-contents page number
+PAGE_QUERY_KEYS = {'page', 'pg', 'paged', 'pagenum', 'page_num'}
+PAGE_PATH_PATTERN = re.compile(r'/page[/-]?(\d+)/?$', re.IGNORECASE)
+# Pager links count pages from the start; larger numbers are more likely post or comment ids
+MAX_TOC_PAGE = 1000
+
+def toc_page_template(url):
+    """Split a pagination URL into (template with a {page} placeholder, page number), or None"""
+    parsed = urlparse(url)._replace(fragment='')
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    for i, (key, value) in enumerate(query):
+        if key.lower() in PAGE_QUERY_KEYS and value.isdigit():
+            query[i] = (key, '{page}')
+            return parsed._replace(query=urlencode(query, safe='{}')).geturl(), int(value)
+    match = PAGE_PATH_PATTERN.search(parsed.path)
+    if match:
+        path = parsed.path[:match.start(1)] + '{page}' + parsed.path[match.end(1):]
+        return parsed._replace(path=path).geturl(), int(match.group(1))
+    return None
+
+def _toc_base(url):
+    """A page URL without its page number, so pagination of the same listing compares equal"""
+    parsed = urlparse(url)
+    path = PAGE_PATH_PATTERN.sub('', parsed.path).rstrip('/')
+    query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k.lower() not in PAGE_QUERY_KEYS]
+    return parsed.netloc.lower(), path, sorted(query)
+
+def looks_like_pager(numbers):
+    """Whether linked page numbers read as a pager: starting near page 1 and counting up without a gap at first"""
+    numbers = sorted(numbers)
+    if numbers[0] > 2 or numbers[-1] > MAX_TOC_PAGE:
+        return False
+    # "1 2 3 ... 40" is fine; a lone link past page 2 is not a pager
+    return len(numbers) == 1 or numbers[1] == numbers[0] + 1
+
+class BookScraper:
+    def __init__(self, rate=1.0, burst=1, cache_dir=None, cache_size=500 * 1024 * 1024,
+                 pool_size=10, connect_timeout=10.0, read_timeout=30.0, retries=3, extraction_engine=None,
+                 single_flight=None, request_hooks=None, respect_robots=True, robots_ttl=24 * 3600.0, hedge=False,
+                 breaker_failures=5, breaker_give_up=600.0):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
         })
+        # pool_size is the number of kept-alive connections per host
+        self.adapter = CountingHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.rate_limiter = RateLimiter(rate=rate, burst=burst)
+        self.cache = HttpCache(cache_dir, cache_size) if cache_dir else None
+        self.retry_policy = RetryPolicy(max_attempts=retries + 1)
+        self.breaker = CircuitBreaker(
+            failures=breaker_failures, give_up_after=breaker_give_up
+        ) if breaker_failures else None
+        self.extraction_engine = extraction_engine or ExtractionEngine(workers=0)
+        # Concurrent requests for the same chapter share one download and extraction
+        self.single_flight = single_flight or SingleFlight()
+        self.request_hooks = list(request_hooks or [])
+        self.robots = RobotsPolicy(
+            self._fetch_robots, self.session.headers['User-Agent'], self.rate_limiter, ttl=robots_ttl
+        ) if respect_robots else None
+        # Hedged requests run the original on a helper thread so it can be raced
+        self.hedging = HedgePolicy() if hedge else None
+        self._hedge_executor = ThreadPoolExecutor(max_workers=4 * pool_size) if hedge else None
+    
+    def connection_stats(self):
+        """Per-host request and connection counts, including how many reused a connection"""
+        stats = {}
+        with self.adapter._stats_lock:
+            for host, counts in self.adapter.connection_stats.items():
+                stats[host] = dict(counts, reused=max(0, counts['requests'] - counts['new_connections']))
+        return stats
+    
+    def _timeout(self, deadline):
+        """Connect/read timeouts, shortened so a request cannot outlive the deadline"""
+        if deadline is None:
+            return (self.connect_timeout, self.read_timeout)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Book deadline exceeded")
+        return (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+    
+    def add_request_hook(self, hook):
+        """Call hook(record) after every request; see MetricsRecorder for the record fields"""
+        self.request_hooks.append(hook)
     
-    def get_chapters(self, url):
-        """Extract chapter links from a book's main page"""
+    def _emit(self, record):
+        for hook in self.request_hooks:
+            try:
+                hook(record)
+            except Exception as e:
+                click.echo(f"Request hook failed: {e}")
+    
+    def _fetch(self, url, deadline=None):
+        """GET a URL through the response cache, within the host's politeness budget"""
+        record = {
+            'url': url,
+            'host': urlparse(url).netloc.lower(),
+            'started': time.time(),
+            'status': None,
+            'error': None,
+            'cache': 'miss' if self.cache else None,
+            'transient': False,
+            'hedged': False,
+            'hedge_won': False,
+            'new_connection': False,
+            'wait': 0.0,
+            'connect': 0.0,
+            'ttfb': 0.0,
+            'transfer': 0.0,
+            'total': 0.0,
+            'wire_bytes': 0,
+            'decoded_bytes': 0,
+        }
+        started = time.perf_counter()
         try:
-            response = self.session.get(url)
-            response.raise_for_status()
+            response = self._fetch_response(url, deadline, record)
+            record['status'] = response.status_code
+            record['decoded_bytes'] = len(response.content)
+            return response
+        except Exception as e:
+            record['error'] = f"{type(e).__name__}: {e}"
+            record['transient'] = is_transient_error(e)
+            raise
+        finally:
+            record['total'] = time.perf_counter() - started
+            self._emit(record)
+    
+    def _fetch_response(self, url, deadline, record):
+        cached = self.cache.get(url) if self.cache else None
+        if cached and self.cache.is_fresh(cached[0]):
+            record['cache'] = 'hit'
+            return cached_response(*cached)
+        headers = self.cache.conditional_headers(cached[0]) if cached else {}
+        
+        self._timeout(deadline)  # fail fast rather than queue for a token we cannot use
+        record['wait'] = self.rate_limiter.acquire(url)
+        if self.hedging:
+            response, timing = self._hedged_get(url, headers, self._timeout(deadline), record)
+        else:
+            response, timing = self._get(self.session, url, headers, self._timeout(deadline))
+        record.update(timing)
+        response.from_cache = False
+        if response.status_code in (429, 503):
+            self.rate_limiter.penalize(url, parse_retry_after(response.headers.get('Retry-After')))
+        
+        if response.status_code == 304 and cached:
+            record['cache'] = 'revalidated'
+            self.cache.refresh(url, cached[0], response)
+            return cached_response(*cached)
+        if self.cache:
+            self.cache.store(url, response)
+        return response
+    
+    def _get(self, session, url, headers, timeout):
+        """GET with the body read; return (response, timing fields for the request record)"""
+        _connect_timing.seconds = 0.0
+        sent = time.perf_counter()
+        response = session.get(url, headers=headers, timeout=timeout, stream=True)
+        headers_received = time.perf_counter()
+        response.content  # read the body now so transfer time is measured separately
+        connect = _connect_timing.seconds
+        return response, {
+            'connect': connect,
+            'new_connection': connect > 0,
+            'ttfb': max(0.0, headers_received - sent - connect),
+            'transfer': time.perf_counter() - headers_received,
+            'wire_bytes': response.raw.tell() if hasattr(response.raw, 'tell') else len(response.content),
+        }
+    
+    def _hedge_get(self, url, headers, timeout):
+        # A session of its own guarantees a new connection instead of queueing
+        # behind, or reusing, the one that stalled
+        with requests.Session() as session:
+            session.headers.update(self.session.headers)
+            adapter = CountingHTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            return self._get(session, url, headers, timeout)
+    
+    def _hedged_get(self, url, headers, timeout, record):
+        """_get, racing a second copy on a fresh connection if the first runs past the host's p95"""
+        host = urlparse(url).netloc.lower()
+        started = time.perf_counter()
+        futures = [self._hedge_executor.submit(self._get, self.session, url, headers, timeout)]
+        threshold = self.hedging.threshold(host)
+        if threshold is not None:
+            try:
+                futures[0].exception(timeout=threshold)
+            except FutureTimeoutError:
+                if self.hedging.try_start(host, lambda: self.rate_limiter.try_acquire(url)):
+                    record['hedged'] = True
+                    futures.append(self._hedge_executor.submit(self._hedge_get, url, headers, timeout))
+        
+        # First successful response wins; the other is abandoned and closed when
+        # it finishes (requests cannot interrupt a read already in progress)
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is not None:
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                self.hedging.observe(host, time.perf_counter() - started)
+                if winner is not futures[0]:
+                    record['hedge_won'] = True
+                    self.hedging.record_win()
+                return winner.result()
+        return futures[0].result()  # both failed: raise the original request's error
+    
+    def _fetch_robots(self, robots_url):
+        # A stored copy younger than the TTL is used as is, so reruns do not refetch it
+        cached = self.cache.get(robots_url) if self.cache else None
+        if cached and time.time() - cached[0]['stored'] < self.robots.ttl:
+            return cached_response(*cached)
+        return self._fetch(robots_url)
+    
+    def _check_robots(self, url):
+        if self.robots and not self.robots.allowed(url):
+            raise FetchError(f"Disallowed by robots.txt: {url}", transient=False)
+    
+    def _fetch_with_retry(self, url, deadline=None):
+        """GET a URL, retrying transient failures; return (response, attempts)
+
+        Raises FetchError, or DeadlineExceeded unchanged once the deadline passes.
+        """
+        self._check_robots(url)
+        self.retry_policy.record_request(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            probe = self.breaker.before(url, deadline) if self.breaker else None
+            try:
+                response = self._fetch(url, deadline)
+                response.raise_for_status()
+                if self.breaker:
+                    self.breaker.record(url, False, probe)
+                return response, attempt
+            except DeadlineExceeded:
+                # Running out of time says nothing about the URL or its host
+                if self.breaker:
+                    self.breaker.record(url, None, probe)
+                raise
+            except Exception as e:
+                if self.breaker:
+                    self.breaker.record(url, is_host_failure(e), probe)
+                transient = is_transient_error(e)
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                delay = self.retry_policy.backoff(attempt)
+                if (
+                    not transient
+                    or attempt >= self.retry_policy.max_attempts
+                    or (deadline is not None and time.monotonic() + delay >= deadline)
+                    or not self.retry_policy.allow_retry(url)
+                ):
+                    raise FetchError(str(e), transient, status, attempt) from e
+            time.sleep(delay)
+    
+    def _probe(self, url, deadline=None):
+        """HEAD a URL following redirects, falling back to a streamed GET; return the final response"""
+        self._check_robots(url)
+        self._timeout(deadline)
+        self.rate_limiter.acquire(url)
+        response = self.session.head(url, allow_redirects=True, timeout=self._timeout(deadline))
+        if response.status_code in HEAD_FALLBACK_STATUSES:
+            self.rate_limiter.acquire(url)
+            response = self.session.get(url, stream=True, timeout=self._timeout(deadline))
+            response.close()  # only the status and headers are needed
+        if response.status_code in (429, 503):
+            self.rate_limiter.penalize(url, parse_retry_after(response.headers.get('Retry-After')))
+        return response
+    
+    def _check_link(self, url, deadline=None):
+        """(final url, problem or None, whether the problem is transient) for one chapter link"""
+        try:
+            response = self._probe(url, deadline)
+        except DeadlineExceeded:
+            return url, "deadline exceeded", True
+        except FetchError as e:
+            return url, str(e), e.transient
+        except requests.RequestException as e:
+            return url, str(e), is_transient_error(e)
+        if response.status_code >= 400:
+            return response.url, f"HTTP {response.status_code}", response.status_code in TRANSIENT_STATUSES
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type and content_type not in HTML_CONTENT_TYPES:
+            return response.url, f"not HTML ({content_type})", False
+        return response.url, None, False
+    
+    def validate_chapters(self, urls, base_url=None, jobs=8, max_per_host=2, deadline=None):
+        """Check discovered chapter links before the expensive download phase
+        
+        Returns (kept, dropped): kept lists the links to download with redirects
+        resolved, and dropped lists (url, reason) pairs for dead, non-HTML,
+        off-site, same-page and duplicate-after-redirect links. Links that only
+        fail transiently are kept, since they may well work when downloaded.
+        """
+        page = normalize_url(base_url) if base_url else None
+        dropped = []
+        candidates = []
+        seen = set()
+        for url in urls:
+            target = normalize_url(url)  # also drops any #fragment
+            if target == page:
+                dropped.append((url, "links back to the table of contents"))
+            elif base_url and not same_site(url, base_url):
+                dropped.append((url, "off-site link"))
+            elif target in seen:
+                dropped.append((url, "duplicate link"))
+            else:
+                seen.add(target)
+                candidates.append(url)
+        
+        kept = []
+        resolved = set()
+        with FetchScheduler(jobs=jobs, max_per_host=max_per_host) as scheduler:
+            checks = scheduler.map_ordered(lambda link: self._check_link(link, deadline), candidates)
+            for url, (final_url, problem, transient) in checks:
+                if problem and not transient:
+                    dropped.append((url, problem))
+                    continue
+                if problem:
+                    click.echo(f"Could not verify {url} ({problem}), keeping it")
+                    final_url = url
+                target = normalize_url(final_url)
+                if base_url and not same_site(final_url, base_url):
+                    dropped.append((url, f"redirects off-site to {final_url}"))
+                elif target in resolved or target == page:
+                    dropped.append((url, f"duplicate of {final_url} after redirect"))
+                else:
+                    resolved.add(target)
+                    kept.append(final_url)
+        return kept, dropped
+    
+    def get_chapters(self, url, deadline=None, max_pages=50, toc_jobs=8):
+        """Extract chapter links from a book's main page and any further TOC pages"""
+        try:
+            response, _ = self._fetch_with_retry(url, deadline)
             
             soup = BeautifulSoup(response.content, 'lxml')
+            pages = [(response.url, soup)]
+            template, last_page, next_url = self._toc_pagination(soup, response.url)
             
-            # Common patterns for chapter links
-            chapter_links = []
-            
-            # Try different selectors based on common book site patterns
-            selectors = [
-                'a[href*="chapter"]',
-                'a[href*="ch-"]', 
-                'a[href*="/ch/"]',
-                '.chapter-link a',
-                '.chapter a',
-                '.toc a',
-                '.table-of-contents a'
-            ]
-            
-            for selector in selectors:
-                links = soup.select(selector)
-                if links:
-                    for link in links:
-                        href = link.get('href')
-                        if href:
-                            full_url = urljoin(url, href)
-                            chapter_links.append(full_url)
-                    break
+            if template:
+                # Numbered pagination: fetch every known page at once, then look at
+                # the last one in case the pager only shows a window of pages
+                own = toc_page_template(response.url)
+                fetched = own[1] if own and own[0] == template else 1
+                while last_page > fetched and len(pages) < max_pages:
+                    numbers = range(fetched + 1, min(last_page, fetched + max_pages - len(pages)) + 1)
+                    batch = self._fetch_toc_pages(
+                        [template.replace('{page}', str(n)) for n in numbers], deadline, toc_jobs
+                    )
+                    pages.extend(batch)
+                    fetched = numbers[-1]
+                    if batch:
+                        more_template, more_last, _ = self._toc_pagination(batch[-1][1], batch[-1][0])
+                        if more_template == template:
+                            last_page = max(last_page, more_last)
+            else:
+                # Only rel="next" links: follow them one page at a time
+                seen = {response.url}
+                while next_url and next_url not in seen and len(pages) < max_pages:
+                    seen.add(next_url)
+                    batch = self._fetch_toc_pages([next_url], deadline, 1)
+                    if not batch:
+                        break
+                    pages.extend(batch)
+                    _, _, next_url = self._toc_pagination(batch[0][1], batch[0][0])
             
-            # Fallback: look for any links that might be chapters
-            if not chapter_links:
-                all_links = soup.find_all('a', href=True)
-                for link in all_links:
-                    href = link.get('href')
-                    text = link.get_text().lower()
-                    if any(word in text for word in ['chapter', 'ch.', 'part']) and href:
-                        full_url = urljoin(url, href)
-                        chapter_links.append(full_url)
+            if len(pages) > 1:
+                click.echo(f"Found {len(pages)} table of contents pages")
+            page_urls = {page_url for page_url, _ in pages}
             
-            # Remove duplicates while preserving order
+            # Remove duplicates while preserving page order
             seen = set()
             unique_chapters = []
-            for link in chapter_links:
-                if link not in seen:
-                    seen.add(link)
-                    unique_chapters.append(link)
+            for page_url, page_soup in pages:
+                for link in self._parse_chapter_links(page_soup, page_url):
+                    if link not in seen and link not in page_urls:
+                        seen.add(link)
+                        unique_chapters.append(link)
             
             return unique_chapters
             
+        except FetchError as e:
+            kind = "transient" if e.transient else "permanent"
+            click.echo(f"Error fetching chapters ({kind}, {e.attempts} attempts): {e}")
+            return []
         except Exception as e:
             click.echo(f"Error fetching chapters: {e}")
             return []
     
-    def get_chapter_text(self, url):
-        """Extract clean chapter content from a URL"""
-        try:
-            response = self.session.get(url)
-            response.raise_for_status()
-            
-            # First try with readability
-            try:
-                # Make sure we pass text content, not bytes
-                doc = Document(response.text)
-                clean_html = doc.summary()
-            except Exception as readability_error:
-                click.echo(f"Readability failed, using fallback method: {readability_error}")
-                # Fallback: use BeautifulSoup to extract content
-                clean_html = self._extract_content_fallback(response.text, url)
-            
-            # Convert to markdown while preserving formatting
-            markdown_content = md(
-                clean_html, 
-                heading_style="ATX",
-                bullets="-",
-                strip=['script', 'style']
-            )
-            
-            # Clean up the markdown
-            markdown_content = re.sub(r'\n\s*\n\s*\n', '\n\n', markdown_content)
-            markdown_content = markdown_content.strip()
-            
-            return markdown_content
-            
-        except Exception as e:
-            click.echo(f"Error fetching chapter from {url}: {e}")
-            return ""
-    
-    def _extract_content_fallback(self, html_content, url):
-        """Fallback content extraction using BeautifulSoup"""
-        soup = BeautifulSoup(html_content, 'lxml')
-        
-        # Remove unwanted elements
-        for element in soup(['script', 'style', 'nav', 'header', 'footer', 'aside', 'advertisement']):
-            element.decompose()
+    def _parse_chapter_links(self, soup, url):
+        """Chapter URLs found on one TOC page, in page order"""
+        # Common patterns for chapter links
+        chapter_links = []
         
-        # Try common content selectors
-        content_selectors = [
-            '.entry-content',
-            '.post-content', 
-            '.chapter-content',
-            '.content',
-            'article',
-            '.text-content',
-            '[class*="content"]',
-            'main',
-            '.post',
-            '.entry'
+        # Try different selectors based on common book site patterns
+        selectors = [
+            'a[href*="chapter"]',
+            'a[href*="ch-"]', 
+            'a[href*="/ch/"]',
+            '.chapter-link a',
+            '.chapter a',
+            '.toc a',
+            '.table-of-contents a'
         ]
         
-        content_element = None
-        for selector in content_selectors:
-            elements = soup.select(selector)
-            if elements:
-                # Find the one with the most text
-                content_element = max(elements, key=lambda x: len(x.get_text()))
+        for selector in selectors:
+            links = soup.select(selector)
+            if links:
+                for link in links:
+                    href = link.get('href')
+                    if href:
+                        full_url = urljoin(url, href)
+                        chapter_links.append(full_url)
                 break
         
-        # If no specific content found, try to find the largest text block
-        if not content_element:
-            # Look for divs or paragraphs with substantial text
-            all_elements = soup.find_all(['div', 'section', 'article'])
-            if all_elements:
-                content_element = max(all_elements, key=lambda x: len(x.get_text()))
+        # Fallback: look for any links that might be chapters
+        if not chapter_links:
+            all_links = soup.find_all('a', href=True)
+            for link in all_links:
+                href = link.get('href')
+                text = link.get_text().lower()
+                if any(word in text for word in ['chapter', 'ch.', 'part']) and href:
+                    full_url = urljoin(url, href)
+                    chapter_links.append(full_url)
         
-        # Last resort: use body content
-        if not content_element:
-            content_element = soup.find('body') or soup
+        return chapter_links
+    
+    def _toc_pagination(self, soup, page_url):
+        """Detect TOC pagination: (page URL template, highest linked page, rel=next URL)
+
+        A numbered pattern only counts when it is the page's own, the one
+        rel=next uses, or a pager over this same listing; chapters linked as
+        ?p=<post id> or a comments pager are left alone.
+        """
+        host = urlparse(page_url).netloc
+        templates = {}
+        for link in soup.find_all('a', href=True):
+            full_url = urljoin(page_url, link['href'])
+            if urlparse(full_url).netloc != host:
+                continue
+            found = toc_page_template(full_url)
+            if found:
+                templates.setdefault(found[0], (full_url, set()))[1].add(found[1])
         
-        # Clean up the selected content
-        if content_element:
-            # Remove navigation and menu elements within content
-            for unwanted in content_element.find_all(['nav', 'menu', '.navigation', '.menu', '.sidebar']):
-                unwanted.decompose()
-            
-            return str(content_element)
+        next_link = soup.find(['link', 'a'], rel='next', href=True)
+        next_url = urljoin(page_url, next_link['href']).split('#')[0] if next_link else None
+        
+        own = toc_page_template(page_url)
+        next_template = toc_page_template(next_url) if next_url else None
+        if next_template:
+            templates.setdefault(next_template[0], (next_url, set()))[1].add(next_template[1])
+        trusted = {found[0] for found in (own, next_template) if found}
+        base = _toc_base(page_url)
+        candidates = {
+            template: numbers for template, (example, numbers) in templates.items()
+            if template in trusted or (_toc_base(example) == base and looks_like_pager(numbers))
+        }
+        if not candidates:
+            return None, 0, next_url
+        # Prefer the pattern rel=next uses, otherwise the one with the most pages linked
+        if next_template and next_template[0] in candidates:
+            template = next_template[0]
+        else:
+            template = max(candidates, key=lambda t: len(candidates[t]))
+        return template, max(candidates[template]), next_url
+    
+    def _fetch_toc_pages(self, page_urls, deadline=None, toc_jobs=8):
+        """Fetch TOC pages concurrently; return (url, soup) pairs in order, skipping failures
+
+        All pages share one host. Callers running inside a FetchScheduler slot
+        pass toc_jobs=1, which fetches on the calling thread so the TOC never
+        takes more than that slot.
+        """
+        def fetch(page_url):
+            try:
+                response, _ = self._fetch_with_retry(page_url, deadline)
+            except (FetchError, DeadlineExceeded) as e:
+                click.echo(f"Error fetching table of contents page {page_url}: {e}")
+                return None
+            return response.url, BeautifulSoup(response.content, 'lxml')
+        
+        if toc_jobs <= 1:
+            return [page for page in map(fetch, page_urls) if page]
+        with ThreadPoolExecutor(max_workers=min(toc_jobs, len(page_urls))) as executor:
+            return [page for page in executor.map(fetch, page_urls) if page]
+    
+    def fetch_chapter(self, url, deadline=None):
+        """Fetch and extract a chapter, returning a ChapterResult rather than raising"""
+        try:
+            return self.single_flight.do(normalize_url(url), self._fetch_chapter, url, deadline)
+        except CancelledError:
+            # The shared download was abandoned by the caller that started it
+            return ChapterResult(url, error="Download cancelled", transient=True)
+    
+    def _fetch_chapter(self, url, deadline=None):
+        started = time.monotonic()
+        try:
+            response, attempts = self._fetch_with_retry(url, deadline)
+        except (FetchError, DeadlineExceeded) as e:
+            result = ChapterResult.from_error(url, e)
+        else:
+            try:
+                content, html = self.extraction_engine.extract(response.content, url, declared_charset(response))
+                result = ChapterResult.from_content(url, content, attempts, html)
+            except Exception as e:
+                result = ChapterResult(url, error=f"Parse failure: {e}", attempts=attempts)
+        result.elapsed = time.monotonic() - started
+        return result
+    
+    def get_chapter_text(self, url, deadline=None):
+        """Extract clean chapter content from a URL"""
+        result = self.fetch_chapter(url, deadline)
+        if not result.ok:
+            click.echo(f"Error fetching chapter from {url}: {result.error}")
+        return result.content
+    
+    def _read_chapters(self, chapters_path):
+        """Chapter HTML in book order, from a store manifest if there is one, else chapter-* files
+
+        Saved HTML fragments are used as they are; markdown is only converted
+        for chapters that have no fragment.
+        """
+        manifest = chapters_path if chapters_path.is_file() else chapters_path / MANIFEST_NAME
+        if not manifest.exists():
+            # Get all chapter files sorted by name, preferring the HTML fragment of each
+            chapter_files = {}
+            for chapter_file in chapters_path.glob("chapter-*.md"):
+                chapter_files.setdefault(chapter_file.stem, chapter_file)
+            for chapter_file in chapters_path.glob("chapter-*.html"):
+                chapter_files[chapter_file.stem] = chapter_file
+            for stem in sorted(chapter_files):
+                with open(chapter_files[stem], 'r', encoding='utf-8') as f:
+                    content = f.read()
+                yield content if chapter_files[stem].suffix == '.html' else self._markdown_to_html(content)
+            return
         
-        return html_content
+        store, chapters = ChapterStore.read_manifest(manifest)
+        for chapter in chapters:
+            if chapter['hash'] is None:
+                click.echo(f"Skipping chapter {chapter['index']}, not in the store: {chapter['url']}")
+                continue
+            html = store.read_html(chapter['hash'])
+            if html is not None:
+                yield f"<h1>Chapter {chapter['index']}</h1>\n{html}"
+            else:
+                yield self._markdown_to_html(f"# Chapter {chapter['index']}\n\n{store.read(chapter['hash'])}")
     
-    def combine_to_pdf(self, chapters_dir, output_file):
-        """Combine markdown chapters into a PDF"""
+    def combine_to_pdf(self, chapters_dir, output_file, boilerplate_threshold=0.5):
+        """Combine chapters (HTML fragments or markdown) into a PDF
+
+        Blocks repeated in more than boilerplate_threshold of the chapters
+        (donation appeals, navigation text) are left out; 0 keeps everything.
+        """
         chapters_path = Path(chapters_dir)
         
         if not chapters_path.exists():
             raise click.ClickException(f"Chapters directory '{chapters_dir}' not found")
         
-        # Get all markdown files sorted by name
-        md_files = sorted(chapters_path.glob("chapter-*.md"))
-        
-        if not md_files:
+        chapters = list(self._read_chapters(chapters_path))
+        if not chapters:
             raise click.ClickException(f"No chapter files found in '{chapters_dir}'")
         
-        # Combine all markdown content
-        combined_content = []
+        chapters, removed = remove_boilerplate(chapters, boilerplate_threshold)
+        if removed:
+            click.echo(f"Removed {removed / 1024:.1f} KB of boilerplate repeated across chapters")
         
-        for md_file in md_files:
-            with open(md_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                combined_content.append(content)
-                combined_content.append("\n\n---\n\n")  # Page break separator
+        combined_content = []
+        for content in chapters:
+            combined_content.append(content)
+            combined_content.append("<hr />")  # Page break separator
         
-        full_markdown = '\n'.join(combined_content)
+        full_html = '\n'.join(combined_content)
         
-        # Convert markdown to HTML with styling
+        # Wrap the chapters in a styled page
         html_content = f"""
         <!DOCTYPE html>
         <html>
@@ -270,7 +2652,7 @@ class BookScraper:
             </style>
         </head>
         <body>
-        {self._markdown_to_html(full_markdown)}
+        {full_html}
         </body>
         </html>
         """
@@ -284,20 +2666,367 @@ class BookScraper:
         md_processor = markdown.Markdown(extensions=['extra', 'codehilite'])
         return md_processor.convert(markdown_text)
 
+class ChapterPipeline:
+    """Fetch chapters on I/O threads and extract them on the scraper's ExtractionEngine
+
+    At most buffer_size fetched pages may be waiting for extraction. Once the
+    buffer is full, fetch workers block until extraction catches up, so a slow
+    CPU stage throttles downloads instead of piling up HTML in memory. With
+    inline extraction (no worker processes) each fetch thread extracts its
+    own page, so there is no buffer.
+    """
+
+    def __init__(self, scraper, scheduler, buffer_size=None):
+        self.scraper = scraper
+        self.scheduler = scheduler
+        self.engine = scraper.extraction_engine
+        self._buffer = None
+        if buffer_size or self.engine.workers:
+            self._buffer = threading.BoundedSemaphore(buffer_size or 2 * self.engine.workers)
+
+    def submit(self, url, deadline=None):
+        """Schedule a chapter and return a Future for its ChapterResult
+
+        A chapter already in flight through the same scraper is shared rather
+        than fetched again.
+        """
+        return self.scraper.single_flight.future(normalize_url(url), lambda: self._start(url, deadline))
+
+    def _start(self, url, deadline):
+        result = Future()
+        fetched = self.scheduler.submit(lambda url: self._fetch(url, deadline), url)
+        fetched.add_done_callback(lambda f: self._extract(f, url, result))
+        result.add_done_callback(lambda f: f.cancelled() and fetched.cancel())
+        return result
+
+    def map_ordered(self, urls, deadline=None):
+        """Yield (url, ChapterResult) pairs in input order while the pipeline runs"""
+        futures = [self.submit(url, deadline) for url in urls]
+        try:
+            for url, future in zip(urls, futures):
+                try:
+                    yield url, future.result()
+                except CancelledError:
+                    # A shared fetch was abandoned by the caller that started it
+                    yield url, ChapterResult(url, error="Download cancelled", transient=True)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _fetch(self, url, deadline):
+        # Runs on a fetch thread; once the page is in it takes a buffer slot,
+        # held until extraction finishes, so only fetched pages are counted
+        started = time.monotonic()
+        response, attempts = self.scraper._fetch_with_retry(url, deadline)
+        if self._buffer:
+            self._buffer.acquire()
+        return response.content, declared_charset(response), attempts, started
+
+    def _extract(self, fetched, url, result):
+        if fetched.cancelled():
+            result.cancel()
+            return
+        if fetched.exception() is not None:
+            self._settle(result, ChapterResult.from_error(url, fetched.exception()))
+            return
+        data, encoding, attempts, started = fetched.result()
+        try:
+            extracted = self.engine.submit(data, url, encoding)
+        except RuntimeError as e:  # pool already shut down
+            self._release()
+            self._settle(result, ChapterResult(url, error=str(e), attempts=attempts))
+            return
+
+        def done(f):
+            self._release()
+            try:
+                content, html = f.result()
+                chapter = ChapterResult.from_content(url, content, attempts, html)
+            except Exception as e:
+                chapter = ChapterResult(url, error=f"Parse failure: {e}", attempts=attempts)
+            chapter.elapsed = time.monotonic() - started
+            self._settle(result, chapter)
+
+        extracted.add_done_callback(done)
+
+    def _release(self):
+        if self._buffer:
+            self._buffer.release()
+
+    @staticmethod
+    def _settle(future, value):
+        try:
+            future.set_result(value)
+        except InvalidStateError:  # cancelled by the consumer meanwhile
+            pass
+
+CHAPTER_FORMATS = ('markdown', 'html', 'both')
+
+def _chapter_file(output_path, i, chapter_format='markdown'):
+    """The file a chapter's journal entry tracks: its markdown, unless only HTML is kept"""
+    return output_path / f"chapter-{i:03d}.{'html' if chapter_format == 'html' else 'md'}"
+
+def _pending_chapters(urls, output_path, journal, verbose=True, store=None, chapter_format='markdown'):
+    """(index, url) pairs for chapters not yet stored, or not complete according to the journal"""
+    pending = []
+    for i, url in enumerate(urls, 1):
+        if store is not None:
+            if store.lookup(url) is not None:
+                if verbose:
+                    click.echo(f"Skipping stored chapter {i}: {url}")
+                continue
+            pending.append((i, url))
+            continue
+        chapter_file = _chapter_file(output_path, i, chapter_format)
+        if journal.is_complete(i, url, chapter_file):
+            if verbose:
+                click.echo(f"Skipping completed chapter {i}: {chapter_file.name}")
+            continue
+        pending.append((i, url))
+    return pending
+
+def _save_chapter(output_path, journal, i, url, result, store=None, chapter_format='markdown'):
+    """Write a finished chapter into its slot (or the store) and journal the outcome; return its bytes
+
+    chapter_format picks markdown, a sanitized HTML fragment (which the PDF
+    stage uses without converting anything), or both.
+    """
+    chapter_file = _chapter_file(output_path, i, chapter_format)
+    html = result.html if chapter_format != 'markdown' else None
+    if store is not None and result.ok:
+        # Headings are added at combine time so the stored body does not depend on its position
+        data = result.content.encode('utf-8')
+        chapter_file = store.path(store.put(result.content, url, html))
+        journal.record(i, url, chapter_file, data, result.elapsed, attempts=result.attempts)
+        return data
+    if not result.ok:
+        journal.record(
+            i, url, chapter_file, None, result.elapsed,
+            error=result.error, attempts=result.attempts, transient=result.transient
+        )
+        return None
+    if html:
+        html_data = f"<h1>Chapter {i}</h1>\n{html}".encode('utf-8')
+        write_atomic(output_path / f"chapter-{i:03d}.html", html_data)
+    if chapter_format == 'html':
+        data = html_data
+    else:
+        data = f"# Chapter {i}\n\n{result.content}".encode('utf-8')
+        write_atomic(chapter_file, data)
+    journal.record(i, url, chapter_file, data, result.elapsed, attempts=result.attempts)
+    return data
+
+def _echo_fetch_stats(scraper):
+    for hook in scraper.request_hooks:
+        if isinstance(hook, AdaptiveConcurrency):
+            for host, limit in hook.limits().items():
+                click.echo(f"  {host}: adaptive concurrency settled at {limit}")
+    if scraper.hedging and scraper.hedging.stats['hedged']:
+        click.echo(
+            f"  Hedged {scraper.hedging.stats['hedged']} slow requests; "
+            f"the hedge answered first {scraper.hedging.stats['won']} times"
+        )
+    coalesced = scraper.single_flight.stats['coalesced']
+    if coalesced:
+        click.echo(f"  Coalesced {coalesced} duplicate chapter requests")
+    for host, stats in scraper.connection_stats().items():
+        click.echo(
+            f"  {host}: {stats['requests']} requests, {stats['new_connections']} new connections, "
+            f"{stats['reused']} reused"
+        )
+    extraction = scraper.extraction_engine.stats()
+    if extraction['tasks']:
+        where = f"on {extraction['workers']} worker processes" if extraction['workers'] else "inline"
+        click.echo(
+            f"  Extraction: {extraction['tasks']} pages {where}, "
+            f"{extraction['mean_wall'] * 1000:.0f} ms mean ({extraction['max_wall'] * 1000:.0f} ms max, "
+            f"{extraction['mean_parse'] * 1000:.0f} ms parsing), "
+            f"{extraction['mean_queued'] * 1000:.0f} ms mean queue wait"
+        )
+        selectors = extraction.get('selectors')
+        if selectors and (selectors['hits'] or selectors['misses']):
+            click.echo(
+                f"  Learned selectors: {selectors['hits']} pages skipped readability, "
+                f"{selectors['misses']} failed the sanity check"
+            )
+    for hook in scraper.request_hooks:
+        if not isinstance(hook, MetricsRecorder):
+            continue
+        hook.extraction = extraction
+        for host, stats in hook.summary().items():
+            phases = ', '.join(f"{phase} {stats[phase]['mean'] * 1000:.0f}" for phase in MetricsRecorder.PHASES)
+            cache = ', '.join(f"{outcome} {count}" for outcome, count in stats['cache'].items())
+            click.echo(f"  {host} timings (mean ms): {phases}; cache: {cache}")
+
+def _site_selectors(options):
+    """Learned content selectors, kept next to the HTTP cache when there is one"""
+    cache_dir = options.get('cache_dir')
+    return SiteSelectors(Path(cache_dir) / 'selectors.json' if cache_dir else None)
+
+def _read_book_specs(books_file, output_root):
+    """Parse a build-many job file into book dicts
+
+    The file is either a JSON list of {"url", "name", "pdf"} objects or plain
+    text with one "URL [name]" per line; blank lines and # comments are ignored.
+    """
+    if str(books_file).endswith('.json'):
+        with open(books_file, 'r', encoding='utf-8') as f:
+            specs = [dict(spec) if isinstance(spec, dict) else {'url': spec} for spec in json.load(f)]
+    else:
+        specs = []
+        with open(books_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split('#', 1)[0].split()
+                if parts:
+                    specs.append({'url': parts[0], 'name': parts[1] if len(parts) > 1 else None})
+
+    books = []
+    names = set()
+    for spec in specs:
+        parsed = urlparse(spec['url'])
+        base = spec.get('name') or re.sub(r'[^\w.-]+', '-', parsed.path.strip('/').split('/')[-1] or parsed.netloc)
+        name = base
+        suffix = 2
+        while name in names:
+            name = f"{base}-{suffix}"
+            suffix += 1
+        names.add(name)
+        books.append({
+            'url': spec['url'],
+            'name': name,
+            'dir': output_root / name,
+            'pdf': Path(spec['pdf']) if spec.get('pdf') else output_root / f"{name}.pdf",
+        })
+    return books
+
+class ChapterPrefetcher:
+    """Warm a ChapterCache on a background thread, one chapter at a time in list order
+
+    Every fetch goes through the scraper, so prefetching stays inside the
+    politeness budget and shares in-flight downloads with foreground requests.
+    update() reorders the remaining work and drops chapters no longer listed.
+    """
+
+    def __init__(self, scraper, cache, urls):
+        self.scraper = scraper
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._urls = list(urls)
+        self._attempted = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='chapter-prefetch', daemon=True)
+        self.fetched = 0
+        self.failed = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def update(self, urls):
+        """Replace the chapter list; URLs left out are cancelled if not yet started"""
+        with self._lock:
+            self._urls = list(urls)
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def progress(self):
+        """(chapters attempted, chapters currently listed)"""
+        with self._lock:
+            return len(self._attempted.intersection(self._urls)), len(self._urls)
+
+    def _next_url(self):
+        with self._lock:
+            for url in self._urls:
+                if url not in self._attempted:
+                    self._attempted.add(url)
+                    return url
+        return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            url = self._next_url()
+            if url is None:
+                return
+            if url in self.cache:
+                continue
+            try:
+                result = self.scraper.fetch_chapter(url)
+                if result.ok:
+                    self.cache.put(url, {'url': url, 'content': result.content, 'html': result.html})
+            except Exception:
+                # One bad chapter must not end prefetching for the rest
+                self.failed += 1
+                continue
+            if result.ok:
+                self.fetched += 1
+            else:
+                self.failed += 1
+
 @click.group()
-def cli():
+@click.option('--rate', default=1.0, show_default=True, help='Maximum requests per second to each host (0 disables)')
+@click.option('--burst', default=1, show_default=True, help='Requests allowed back-to-back before the rate applies')
+@click.option('--cache-dir', default='.book_cache', show_default=True, help='Directory for the persistent HTTP cache')
+@click.option('--cache-size', default=500, show_default=True, help='HTTP cache size cap in MB')
+@click.option('--no-cache', is_flag=True, help='Disable the HTTP cache')
+@click.option('--pool-size', default=10, show_default=True, help='Kept-alive connections per host')
+@click.option('--connect-timeout', default=10.0, show_default=True, help='Seconds allowed to open a connection')
+@click.option('--read-timeout', default=30.0, show_default=True, help='Seconds allowed between bytes of a response')
+@click.option('--retries', default=3, show_default=True, help='Retries for timeouts, 429 and 5xx responses')
+@click.option('--metrics', 'metrics_path', default=None, help='Write per-request timing metrics as JSON to this file')
+@click.option('--ignore-robots', is_flag=True, help="Ignore robots.txt Disallow and Crawl-delay rules")
+@click.option('--hedge', is_flag=True, help="Re-issue requests that run past the host's p95 latency on a new connection")
+@click.option('--breaker-failures', default=5, show_default=True,
+              help='Consecutive failures that open a host\'s circuit breaker (0 disables it)')
+@click.option('--breaker-give-up', default=600.0, show_default=True,
+              help='Seconds a host may keep failing before its remaining requests are aborted (0 = abort at once)')
+@click.pass_context
+def cli(ctx, rate, burst, cache_dir, cache_size, no_cache, pool_size, connect_timeout, read_timeout, retries,
+        metrics_path, ignore_robots, hedge, breaker_failures, breaker_give_up):
     """A CLI tool for scraping web books and converting them to various formats."""
-    pass
+    ctx.obj = {
+        'rate': rate,
+        'burst': burst,
+        'cache_dir': None if no_cache else cache_dir,
+        'cache_size': cache_size * 1024 * 1024,
+        'pool_size': pool_size,
+        'connect_timeout': connect_timeout,
+        'read_timeout': read_timeout,
+        'retries': retries,
+        'respect_robots': not ignore_robots,
+        'hedge': hedge,
+        'breaker_failures': breaker_failures,
+        'breaker_give_up': breaker_give_up,
+    }
+    if metrics_path:
+        recorder = MetricsRecorder(metrics_path)
+        ctx.obj['request_hooks'] = [recorder]
+        ctx.call_on_close(recorder.write)
 
 @cli.command()
 @click.argument('url')
 @click.option('--output', '-o', default='chapters.txt', help='Output file for chapter links')
-def get_chapters(url, output):
+@click.option('--max-pages', default=50, show_default=True, help='Maximum table of contents pages to crawl')
+@click.option('--validate', is_flag=True, help='Check links first and drop dead, duplicate, off-site and non-HTML ones')
+@click.option('--jobs', '-j', default=8, show_default=True, help='Concurrent link checks when validating')
+@click.option('--max-per-host', '-m', default=2, show_default=True, help='Maximum concurrent TOC page fetches and link checks to a single host')
+@click.pass_obj
+def get_chapters(options, url, output, max_pages, validate, jobs, max_per_host):
     """Extract chapter links from a book URL"""
-    scraper = BookScraper()
+    scraper = BookScraper(**options)
     
     click.echo(f"Fetching chapters from: {url}")
-    chapters = scraper.get_chapters(url)
+    chapters = scraper.get_chapters(url, max_pages=max_pages, toc_jobs=max_per_host)
+    
+    if chapters and validate:
+        click.echo(f"Validating {len(chapters)} links...")
+        chapters, dropped = scraper.validate_chapters(chapters, url, jobs=jobs, max_per_host=max_per_host)
+        for link, reason in dropped:
+            click.echo(f"  Dropped {link}: {reason}")
     
     if not chapters:
         raise click.ClickException("No chapters found!")
@@ -311,10 +3040,20 @@ def get_chapters(url, output):
 @cli.command()
 @click.argument('chapters_file')
 @click.option('--output-dir', '-d', default='chapters', help='Output directory for chapter files')
-def get_chapter_text(chapters_file, output_dir):
+@click.option('--jobs', '-j', default=1, show_default=True, help='Number of chapters to download concurrently')
+@click.option('--max-per-host', '-m', default=1, show_default=True, help='Maximum concurrent requests to a single host')
+@click.option('--book-timeout', type=float, default=None, help='Give up on remaining chapters after this many seconds')
+@click.option('--retry-failed', is_flag=True, help='Only retry chapters the journal records as failed')
+@click.option('--extract-workers', type=int, default=None, help='Processes for HTML extraction (default: CPU count, 0 = inline)')
+@click.option('--store', 'store_dir', default=None, help='Keep chapters in this content-addressed store and write a manifest')
+@click.option('--adaptive', is_flag=True, help='Adapt per-host concurrency, from --max-per-host up to --jobs')
+@click.option('--format', 'chapter_format', type=click.Choice(CHAPTER_FORMATS), default='both', show_default=True,
+              help='Save markdown, sanitized HTML fragments (used directly for the PDF), or both')
+@click.option('--readability-only', is_flag=True, help='Run readability on every page instead of learning site selectors')
+@click.pass_obj
+def get_chapter_text(options, chapters_file, output_dir, jobs, max_per_host, book_timeout, retry_failed, extract_workers,
+                     store_dir, adaptive, chapter_format, readability_only):
     """Download chapter content from a list of URLs"""
-    scraper = BookScraper()
-    
     # Create output directory
     output_path = Path(output_dir)
     output_path.mkdir(exist_ok=True)
@@ -323,46 +3062,188 @@ def get_chapter_text(chapters_file, output_dir):
     with open(chapters_file, 'r') as f:
         urls = [line.strip() for line in f if line.strip()]
     
-    click.echo(f"Downloading {len(urls)} chapters...")
+    journal = DownloadJournal(output_path / 'journal.json')
+    store = ChapterStore(store_dir) if store_dir else None
     
-    for i, url in enumerate(urls, 1):
-        chapter_file = output_path / f"chapter-{i:03d}.md"
-        if chapter_file.exists():
-            click.echo(f"Skipping existing chapter {i}: {chapter_file.name}")
-            continue
+    if retry_failed:
+        # Trust the journal instead of re-verifying every completed chapter
+        pending = journal.failed()
+        click.echo(f"Retrying {len(pending)} failed chapters...")
+    else:
+        click.echo(f"Downloading {len(urls)} chapters...")
+        pending = _pending_chapters(urls, output_path, journal, store=store, chapter_format=chapter_format)
 
-        click.echo(f"Downloading chapter {i}/{len(urls)}: {url}")
-        
-        content = scraper.get_chapter_text(url)
-        
-        if content:
-            with open(chapter_file, 'w', encoding='utf-8') as f:
-                f.write(f"# Chapter {i}\n\n")
-                f.write(content)
+    engine = ExtractionEngine(
+        extract_workers if pending else 0, selectors=None if readability_only else _site_selectors(options)
+    )
+    scraper = BookScraper(extraction_engine=engine, **options)
+    controller = AdaptiveConcurrency(initial=max_per_host, maximum=jobs) if adaptive else None
+    if controller:
+        scraper.add_request_hook(controller)
+
+    saved = 0
+    total_bytes = 0
+    started = time.monotonic()
+    deadline = started + book_timeout if book_timeout else None
+
+    with journal, engine, FetchScheduler(jobs=jobs, max_per_host=max_per_host, controller=controller) as scheduler:
+        pipeline = ChapterPipeline(scraper, scheduler)
+        results = pipeline.map_ordered([url for _, url in pending], deadline)
+        for (i, _), (url, result) in zip(pending, results):
+            if controller:
+                host = urlparse(url).netloc.lower()
+                click.echo(f"Downloaded chapter {i}/{len(urls)}: {url} [{host} concurrency {controller.limit(host)}]")
+            else:
+                click.echo(f"Downloaded chapter {i}/{len(urls)}: {url}")
             
-            click.echo(f"  Saved to {chapter_file}")
-        else:
-            click.echo(f"  Failed to download chapter {i}")
-        
-        # Be nice to the server
-        time.sleep(1)
+            data = _save_chapter(output_path, journal, i, url, result, store, chapter_format)
+            if data is not None:
+                saved += 1
+                total_bytes += len(data)
+                
+                if store is not None:
+                    click.echo(f"  Stored as {ChapterStore.content_hash(result.content)[:12]}")
+                else:
+                    click.echo(f"  Saved to {_chapter_file(output_path, i, chapter_format)}")
+            else:
+                kind = "transient" if result.transient else "permanent"
+                click.echo(f"  Failed to download chapter {i} ({kind}, {result.attempts} attempts): {result.error}")
     
-    click.echo(f"Chapter download complete! Files saved in '{output_dir}'")
+    elapsed = max(time.monotonic() - started, 1e-6)
+    if store is not None:
+        chapters = store.write_manifest(output_path / MANIFEST_NAME, urls)
+        stored = sum(1 for chapter in chapters if chapter['hash'])
+        unique = len({chapter['hash'] for chapter in chapters if chapter['hash']})
+        click.echo(
+            f"Chapter download complete! Manifest of {stored}/{len(urls)} chapters ({unique} unique) "
+            f"saved to '{output_path / MANIFEST_NAME}'"
+        )
+    else:
+        click.echo(f"Chapter download complete! Files saved in '{output_dir}'")
+    if pending:
+        click.echo(
+            f"Fetched {saved}/{len(pending)} chapters ({total_bytes / 1024:.1f} KB) in {elapsed:.1f}s: "
+            f"{saved / elapsed:.2f} chapters/s, {total_bytes / 1024 / elapsed:.1f} KB/s"
+        )
+    _echo_fetch_stats(scraper)
 
 @cli.command()
 @click.argument('chapters_dir')
 @click.argument('output_file')
-def combine_book(chapters_dir, output_file):
+@click.option('--boilerplate-threshold', type=float, default=0.5, show_default=True,
+              help='Drop blocks repeated in more than this fraction of chapters (0 keeps everything)')
+@click.pass_obj
+def combine_book(options, chapters_dir, output_file, boilerplate_threshold):
     """Combine chapter files into a PDF"""
-    scraper = BookScraper()
+    scraper = BookScraper(**options)
     
     click.echo(f"Combining chapters from '{chapters_dir}' into '{output_file}'")
     
     try:
-        scraper.combine_to_pdf(chapters_dir, output_file)
+        scraper.combine_to_pdf(chapters_dir, output_file, boilerplate_threshold)
         click.echo(f"PDF created successfully: {output_file}")
     except Exception as e:
         raise click.ClickException(f"Failed to create PDF: {e}")
 
+@cli.command()
+@click.argument('books_file')
+@click.option('--output-root', '-d', default='books', help='Directory that receives one folder and PDF per book')
+@click.option('--jobs', '-j', default=8, show_default=True, help='Total concurrent downloads across all books')
+@click.option('--max-per-host', '-m', default=2, show_default=True, help='Maximum concurrent requests to a single host')
+@click.option('--extract-workers', type=int, default=None, help='Processes for HTML extraction (default: CPU count, 0 = inline)')
+@click.option('--store', 'store_dir', default=None, help='Keep chapters in this content-addressed store shared by all books')
+@click.option('--adaptive', is_flag=True, help='Adapt per-host concurrency, from --max-per-host up to --jobs')
+@click.option('--format', 'chapter_format', type=click.Choice(CHAPTER_FORMATS), default='both', show_default=True,
+              help='Save markdown, sanitized HTML fragments (used directly for the PDF), or both')
+@click.option('--readability-only', is_flag=True, help='Run readability on every page instead of learning site selectors')
+@click.option('--boilerplate-threshold', type=float, default=0.5, show_default=True,
+              help='Drop blocks repeated in more than this fraction of a book\'s chapters (0 keeps everything)')
+@click.pass_obj
+def build_many(options, books_file, output_root, jobs, max_per_host, extract_workers, store_dir, adaptive,
+               chapter_format, readability_only, boilerplate_threshold):
+    """Build PDFs for every book listed in a file, sharing one download scheduler"""
+    books = _read_book_specs(books_file, Path(output_root))
+    if not books:
+        raise click.ClickException(f"No books listed in '{books_file}'")
+    click.echo(f"Building {len(books)} books...")
+
+    engine = ExtractionEngine(extract_workers, selectors=None if readability_only else _site_selectors(options))
+    scraper = BookScraper(extraction_engine=engine, **options)
+    store = ChapterStore(store_dir) if store_dir else None
+    controller = AdaptiveConcurrency(initial=max_per_host, maximum=jobs) if adaptive else None
+    if controller:
+        scraper.add_request_hook(controller)
+    started = time.monotonic()
+    saved = 0
+    total_bytes = 0
+
+    def render(book):
+        if store is not None:
+            store.write_manifest(book['dir'] / MANIFEST_NAME, book['chapters'])
+        scraper.combine_to_pdf(book['dir'], book['pdf'], boilerplate_threshold)
+        return book
+
+    # One scheduler carries every book's requests, so per-host limits hold
+    # globally while different hosts keep each other's idle slots busy. PDFs
+    # render on their own thread as soon as a book's last chapter lands.
+    with engine, FetchScheduler(jobs=jobs, max_per_host=max_per_host, controller=controller) as scheduler, \
+            ThreadPoolExecutor(max_workers=1) as renderer:
+        pipeline = ChapterPipeline(scraper, scheduler)
+        # Each book's TOC pages are fetched one by one inside the scheduler slot
+        # its get_chapters task holds, so they count against the per-host limit
+        get_chapters = partial(scraper.get_chapters, toc_jobs=1)
+        waiting = {scheduler.submit(get_chapters, book['url']): (book, None, None) for book in books}
+        renders = {}
+        while waiting:
+            done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done:
+                book, i, url = waiting.pop(future)
+                if i is None:
+                    chapters = future.result()
+                    if not chapters:
+                        click.echo(f"[{book['name']}] No chapters found, skipping")
+                        continue
+                    book['dir'].mkdir(parents=True, exist_ok=True)
+                    write_atomic(book['dir'] / 'chapters.txt', ''.join(f"{c}\n" for c in chapters))
+                    book['chapters'] = chapters
+                    book['journal'] = DownloadJournal(book['dir'] / 'journal.json')
+                    pending = _pending_chapters(
+                        chapters, book['dir'], book['journal'], verbose=False, store=store, chapter_format=chapter_format
+                    )
+                    book['remaining'] = len(pending)
+                    click.echo(f"[{book['name']}] {len(chapters)} chapters, {len(pending)} to download")
+                    for i, url in pending:
+                        waiting[pipeline.submit(url)] = (book, i, url)
+                else:
+                    result = future.result()
+                    data = _save_chapter(book['dir'], book['journal'], i, url, result, store, chapter_format)
+                    if data is None:
+                        click.echo(f"[{book['name']}] Failed to download chapter {i}: {result.error}")
+                    else:
+                        saved += 1
+                        total_bytes += len(data)
+                    book['remaining'] -= 1
+                if book.get('remaining') == 0:
+                    book['journal'].close()
+                    click.echo(f"[{book['name']}] Chapters complete, rendering {book['pdf']}")
+                    renders[renderer.submit(render, book)] = book
+                    book['remaining'] = None
+
+        failed = 0
+        for future, book in renders.items():
+            try:
+                future.result()
+                click.echo(f"[{book['name']}] PDF created successfully: {book['pdf']}")
+            except Exception as e:
+                failed += 1
+                click.echo(f"[{book['name']}] Failed to create PDF: {e}")
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    click.echo(
+        f"Built {len(renders) - failed}/{len(books)} books; fetched {saved} chapters "
+        f"({total_bytes / 1024:.1f} KB) in {elapsed:.1f}s: {saved / elapsed:.2f} chapters/s"
+    )
+    _echo_fetch_stats(scraper)
+
 if __name__ == '__main__':
     cli() 
\ No newline at end of file
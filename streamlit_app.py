@@ -2,11 +2,11 @@ import streamlit as st
 import pandas as pd
 import tempfile
 import os
-import time
 from pathlib import Path
 import zipfile
-from book_scraper import BookScraper
+from book_scraper import BookScraper, ChapterCache, ChapterPipeline, ChapterPrefetcher, ExtractionEngine, FetchScheduler
 import base64
+from html import escape
 
 # Configure page
 st.set_page_config(
@@ -15,20 +15,55 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def get_extraction_engine():
+    """One pool of extraction processes shared by every session
+
+    A single worker by default: cpu_count() reports the host's CPUs, not the
+    container's share, and every worker imports lxml and readability. Set
+    EXTRACT_WORKERS to use more, or 0 to extract inline.
+    """
+    return ExtractionEngine(workers=int(os.environ.get('EXTRACT_WORKERS', 1)))
+
+@st.cache_resource
+def get_chapter_cache():
+    """Extracted chapters shared by every session and kept across page refreshes"""
+    return ChapterCache(
+        directory=os.environ.get('CHAPTER_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'chapter_cache')),
+        memory_bytes=int(os.environ.get('CHAPTER_CACHE_MB', 64)) * 1024 * 1024
+    )
+
+@st.cache_resource
+def get_scraper():
+    """One scraper per process so every session shares its politeness budget and in-flight downloads"""
+    return BookScraper(
+        rate=2.0,
+        extraction_engine=get_extraction_engine(),
+        cache_dir=os.environ.get('BOOK_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'book_cache'))
+    )
+
 # Initialize session state
 if 'chapters' not in st.session_state:
     st.session_state.chapters = []
-if 'scraper' not in st.session_state:
-    st.session_state.scraper = BookScraper()
 if 'chapters_content' not in st.session_state:
     st.session_state.chapters_content = {}
-if 'chapter_cache' not in st.session_state:
-    st.session_state.chapter_cache = {}  # Cache individual chapters by URL
 if 'pdf_ready' not in st.session_state:
     st.session_state.pdf_ready = False
 if 'pdf_path' not in st.session_state:
     st.session_state.pdf_path = None
 
+def stop_prefetch():
+    """Stop this session's background prefetcher, if any"""
+    prefetcher = st.session_state.pop('prefetcher', None)
+    if prefetcher:
+        prefetcher.stop()
+
+def start_prefetch(urls):
+    """Start warming the shared chapter cache in the background"""
+    stop_prefetch()
+    if st.session_state.get('prefetch_enabled', True):
+        st.session_state.prefetcher = ChapterPrefetcher(get_scraper(), get_chapter_cache(), urls).start()
+
 def get_download_link(file_path, file_name):
     """Generate download link for file"""
     with open(file_path, "rb") as f:
@@ -40,7 +75,7 @@ def get_download_link(file_path, file_name):
 def extract_chapters(url):
     """Extract chapters from URL"""
     with st.spinner("🔍 Finding chapters..."):
-        chapters = st.session_state.scraper.get_chapters(url)
+        chapters = get_scraper().get_chapters(url, toc_jobs=2)
         if chapters:
             # Create a dataframe for better display
             chapter_data = []
@@ -63,15 +98,19 @@ def download_chapters(chapter_df):
     selected_chapters = chapter_df[chapter_df['include']].copy()
     selected_chapters = selected_chapters.sort_values('order').reset_index(drop=True)
     
+    chapter_cache = get_chapter_cache()
+    
     # Check which chapters need downloading
     chapters_to_download = []
-    cached_count = 0
+    cached = {}
     
     for _, row in selected_chapters.iterrows():
-        if row['url'] not in st.session_state.chapter_cache:
+        entry = chapter_cache.get(row['url'])
+        if entry is None:
             chapters_to_download.append(row)
         else:
-            cached_count += 1
+            cached[row['url']] = entry
+    cached_count = len(cached)
     
     # Show caching info
     if cached_count > 0:
@@ -81,34 +120,37 @@ def download_chapters(chapter_df):
     if chapters_to_download:
         progress_bar = st.progress(0)
         status_text = st.empty()
+        failures = []
         
-        for idx, row in enumerate(chapters_to_download):
-            progress = (idx + 1) / len(chapters_to_download)
-            progress_bar.progress(progress)
-            status_text.text(f"📖 Downloading: {row['title']} ({idx + 1}/{len(chapters_to_download)})")
-            
-            content = st.session_state.scraper.get_chapter_text(row['url'])
-            if content:
-                # Cache the downloaded content
-                st.session_state.chapter_cache[row['url']] = {
-                    'title': row['title'],
-                    'content': content,
-                    'url': row['url']
-                }
-            
-            # Small delay to be respectful
-            time.sleep(0.5)
+        # Fetch a few chapters at once and extract them on the shared process pool
+        with FetchScheduler(jobs=4, max_per_host=2) as scheduler:
+            pipeline = ChapterPipeline(get_scraper(), scheduler)
+            results = pipeline.map_ordered([row['url'] for row in chapters_to_download])
+            for idx, (row, (_, result)) in enumerate(zip(chapters_to_download, results)):
+                progress = (idx + 1) / len(chapters_to_download)
+                progress_bar.progress(progress)
+                status_text.text(f"📖 Downloaded: {row['title']} ({idx + 1}/{len(chapters_to_download)})")
+                
+                if result.ok:
+                    # Cache the downloaded content for every session
+                    entry = {'url': row['url'], 'content': result.content, 'html': result.html}
+                    chapter_cache.put(row['url'], entry)
+                    cached[row['url']] = entry
+                else:
+                    failures.append(f"{row['title']}: {result.error}")
         
         progress_bar.progress(1.0)
         status_text.text("✅ All new chapters downloaded!")
+        if failures:
+            st.warning(f"⚠️ {len(failures)} chapters could not be downloaded:\n\n" + "\n".join(f"- {f}" for f in failures))
     else:
         st.success("✅ All chapters already cached - no downloads needed!")
     
     # Build final chapters_content from cache
     chapters_content = {}
     for _, row in selected_chapters.iterrows():
-        if row['url'] in st.session_state.chapter_cache:
-            cached_chapter = st.session_state.chapter_cache[row['url']].copy()
+        if row['url'] in cached:
+            cached_chapter = dict(cached[row['url']])
             cached_chapter['title'] = row['title']  # Use current title (might be edited)
             chapters_content[row['order']] = cached_chapter
     
@@ -122,8 +164,14 @@ def create_pdf(chapters_content, book_title="My Book"):
         chapters_dir = Path(temp_dir) / "chapters"
         chapters_dir.mkdir(exist_ok=True)
         
-        # Write chapters to markdown files
+        # Write chapters as HTML fragments, or markdown for entries cached before fragments were kept
         for order, chapter_data in sorted(chapters_content.items()):
+            if chapter_data.get('html'):
+                chapter_file = chapters_dir / f"chapter-{order:03d}.html"
+                with open(chapter_file, 'w', encoding='utf-8') as f:
+                    f.write(f"<h1>{escape(chapter_data['title'])}</h1>\n")
+                    f.write(chapter_data['html'])
+                continue
             chapter_file = chapters_dir / f"chapter-{order:03d}.md"
             with open(chapter_file, 'w', encoding='utf-8') as f:
                 f.write(f"# {chapter_data['title']}\n\n")
@@ -132,7 +180,7 @@ def create_pdf(chapters_content, book_title="My Book"):
         # Generate PDF
         pdf_path = Path(temp_dir) / f"{book_title.replace(' ', '_')}.pdf"
         try:
-            st.session_state.scraper.combine_to_pdf(str(chapters_dir), str(pdf_path))
+            get_scraper().combine_to_pdf(str(chapters_dir), str(pdf_path))
             return str(pdf_path)
         except Exception as e:
             st.error(f"Error creating PDF: {e}")
@@ -154,6 +202,7 @@ if url and st.button("🔍 Find Chapters", type="primary"):
     chapters_df = extract_chapters(url)
     if chapters_df is not None and not chapters_df.empty:
         st.session_state.chapters = chapters_df
+        start_prefetch(chapters_df['url'].tolist())
         st.success(f"Found {len(chapters_df)} chapters!")
         st.rerun()
     else:
@@ -167,6 +216,14 @@ if len(st.session_state.chapters) > 0:
     # Sort chapters by order
     sorted_chapters = st.session_state.chapters.sort_values('order').reset_index(drop=True)
     
+    # Keep the background prefetch in step with reordering and deletions
+    prefetcher = st.session_state.get('prefetcher')
+    if prefetcher:
+        prefetcher.update(sorted_chapters['url'].tolist())
+        if prefetcher.running:
+            attempted, total = prefetcher.progress()
+            st.caption(f"⚡ Prefetching chapters in the background: {attempted}/{total}")
+    
     # Display each chapter with controls
     st.markdown("### 📚 Chapter List")
     
@@ -342,14 +399,29 @@ with st.sidebar:
     """)
     
     # Show cache info
-    if 'chapter_cache' in st.session_state and st.session_state.chapter_cache:
-        cache_count = len(st.session_state.chapter_cache)
+    cache_summary = get_chapter_cache().summary()
+    if cache_summary['disk_entries'] or cache_summary['memory_entries']:
+        cache_count = max(cache_summary['disk_entries'], cache_summary['memory_entries'])
         st.markdown(f"### 💾 Cache Info")
-        st.info(f"📚 {cache_count} chapters cached for faster regeneration")
+        st.info(
+            f"📚 {cache_count} chapters cached for faster regeneration "
+            f"({cache_summary['memory_bytes'] / (1024 * 1024):.1f} MB in memory, shared by all users)"
+        )
+        coalesced = get_scraper().single_flight.stats['coalesced']
+        if coalesced:
+            st.caption(f"🔗 {coalesced} duplicate chapter downloads shared between users")
+    
+    st.checkbox(
+        "⚡ Prefetch chapters in background",
+        value=True,
+        key="prefetch_enabled",
+        help="Start downloading chapters as soon as they are found, while you arrange the list"
+    )
     
     # Reset button
     if st.button("🔄 Start Over"):
-        for key in ['chapters', 'chapters_content', 'chapter_cache', 'pdf_ready', 'pdf_path']:
+        stop_prefetch()
+        for key in ['chapters', 'chapters_content', 'pdf_ready', 'pdf_path']:
             if key in st.session_state:
                 del st.session_state[key]
         st.rerun()
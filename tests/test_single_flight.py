@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+
+from book_scraper import BookScraper, ChapterPipeline, ExtractionEngine, FetchScheduler
+
+PAGE = b'<html><body><div><p>' + b'Chapter text. ' * 40 + b'</p></div></body></html>'
+
+
+class _Response:
+    content = PAGE
+    headers = {'Content-Type': 'text/html; charset=utf-8'}
+
+
+class SharedChapterTest(unittest.TestCase):
+    """Two sessions, each with its own pipeline and scheduler, sharing one scraper"""
+
+    def setUp(self):
+        self.engine = ExtractionEngine(workers=0)
+        self.scraper = BookScraper(extraction_engine=self.engine, respect_robots=False)
+        self.fetched = []
+
+        def fetch(url, deadline=None):
+            time.sleep(0.05)
+            self.fetched.append(url)
+            return _Response(), 1
+
+        self.scraper._fetch_with_retry = fetch
+        self.urls = [f'http://example.test/chapter-{i}' for i in range(6)]
+
+    def tearDown(self):
+        self.engine.shutdown()
+
+    def test_shutdown_of_one_scheduler_does_not_cancel_another_sessions_chapters(self):
+        first = FetchScheduler(jobs=1, max_per_host=1)
+        second = FetchScheduler(jobs=1, max_per_host=1)
+        try:
+            first_pipeline = ChapterPipeline(self.scraper, first)
+            for url in self.urls:
+                first_pipeline.submit(url)
+            second_futures = [ChapterPipeline(self.scraper, second).submit(url) for url in self.urls]
+            self.assertEqual(self.scraper.single_flight.stats['coalesced'], len(self.urls))
+
+            # The first session goes away with most of its fetches still queued
+            first.shutdown(wait=False)
+
+            results = [future.result(timeout=10) for future in second_futures]
+            self.assertTrue(all(result.ok for result in results), [result.error for result in results])
+            self.assertGreater(self.scraper.single_flight.stats['restarted'], 0)
+            self.assertEqual(sorted(self.fetched), sorted(self.urls))
+        finally:
+            first.shutdown()
+            second.shutdown()
+
+    def test_shared_chapter_is_cancelled_once_every_caller_gives_up(self):
+        blocker = threading.Event()
+
+        def fetch(url, deadline=None):
+            blocker.wait(5)
+            return _Response(), 1
+
+        self.scraper._fetch_with_retry = fetch
+        with FetchScheduler(jobs=1, max_per_host=1) as first, FetchScheduler(jobs=1, max_per_host=1) as second:
+            busy = ChapterPipeline(self.scraper, first).submit('http://example.test/busy')
+            queued = [
+                ChapterPipeline(self.scraper, scheduler).submit('http://example.test/queued')
+                for scheduler in (first, second)
+            ]
+            queued[0].cancel()
+            self.assertFalse(queued[1].done())
+            queued[1].cancel()
+            blocker.set()
+            self.assertTrue(busy.result(timeout=10).ok)
+            self.assertEqual(self.scraper.single_flight.stats['restarted'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()